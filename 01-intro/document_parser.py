@@ -1,25 +1,207 @@
+import hashlib
 import json
+import marshal
+import os
+from collections.abc import Iterator
+from functools import cached_property
+from typing import Any, TextIO
+
+from tracing import span
+
+
+CHUNK_SIZE = 64 * 1024
+CACHE_VERSION = 2
+
+
+class _JsonStream:
+    """Pull parser reading a JSON file in chunks - only one value is held in memory at a time."""
+
+    WHITESPACE = " \t\r\n"
+
+    def __init__(self, file: TextIO, chunk_size: int = CHUNK_SIZE) -> None:
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self) -> bool:
+        chunk = self.file.read(self.chunk_size)
+        if not chunk:
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Return the next non-whitespace character without consuming it ("" at EOF)."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in self.WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char: str) -> None:
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r} in {self.file.name}, found {found!r}")
+        self.pos += 1
+
+    def accept(self, char: str) -> bool:
+        if self.peek() == char:
+            self.pos += 1
+            return True
+        return False
+
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # a number may be cut at the chunk boundary, make sure it is complete
+            if end == len(self.buffer) and self._fill():
+                continue
+            self.pos = end
+            return value
+
 
 class DocumentParser:
+    """
+    Flattens the FAQ dump ([{"course": ..., "documents": [...]}, ...]) into a list of documents
+    with the course name added to every document.
+
+    The flattened corpus is stored next to the source file in a compiled, columnar cache
+    (marshal format) keyed by the source mtime, size and sha256, so next runs skip JSON parsing.
+    """
 
-    def __init__(self, documents_file: str):
+    def __init__(self, documents_file: str, cache_file: str | None = None, use_cache: bool = True):
         self.documents_file = documents_file
+        self.cache_file = cache_file or f"{documents_file}.cache"
+        self.use_cache = use_cache
 
-    @property
-    def _documents(self):
-        with open(self.documents_file, 'r') as file:
-            documents = json.load(file)
-        return documents
+    def iter_documents(self) -> Iterator[dict[str, str]]:
+        """Lazily yield flattened documents, parsing the source file incrementally."""
+        with open(self.documents_file, "r", encoding="utf-8") as file:
+            stream = _JsonStream(file)
+            stream.expect("[")
+            while stream.peek() != "]":
+                yield from self._iter_course(stream)
+                stream.accept(",")
+            stream.expect("]")
+
+    @staticmethod
+    def _iter_course(stream: _JsonStream) -> Iterator[dict[str, str]]:
+        stream.expect("{")
+        course = None
+        pending = []  # documents listed before the "course" key
+        while stream.peek() != "}":
+            key = stream.value()
+            stream.expect(":")
+            if key == "documents":
+                stream.expect("[")
+                while stream.peek() != "]":
+                    document = stream.value()
+                    if course is None:
+                        pending.append(document)
+                    else:
+                        yield {**document, "course": course}
+                    stream.accept(",")
+                stream.expect("]")
+            elif key == "course":
+                course = stream.value()
+            else:
+                stream.value()
+            stream.accept(",")
+        stream.expect("}")
+        for document in pending:
+            yield {**document, "course": course}
 
-    @property
+    @cached_property
     def parsed_documents(self) -> list[dict[str, str]]:
-        def add_course(document: dict[str, str], course: str) -> dict[str, str]:
-            document["course"] = course
-            return document
-        
-        output = []
-        for document in self._documents:
-            output.extend(list(map(lambda el: add_course(el, document["course"]), document["documents"])))
-        return output
-    
-    
+        with span("documents.parse") as parse_span:
+            documents = self._load_cache() if self.use_cache else None
+            parse_span.attributes["from_cache"] = documents is not None
+            if documents is None:
+                documents = list(self.iter_documents())
+                if self.use_cache:
+                    self._write_cache(documents)
+            parse_span.attributes["documents"] = len(documents)
+        return documents
+
+    def _source_hash(self) -> str:
+        sha256 = hashlib.sha256()
+        with open(self.documents_file, "rb") as file:
+            while chunk := file.read(CHUNK_SIZE):
+                sha256.update(chunk)
+        return sha256.hexdigest()
+
+    def _source_key(self, sha256: str | None = None) -> dict[str, Any]:
+        stat = os.stat(self.documents_file)
+        return {
+            "version": CACHE_VERSION,
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "sha256": sha256 or self._source_hash(),
+        }
+
+    def _load_cache(self) -> list[dict[str, str]] | None:
+        if not os.path.exists(self.cache_file):
+            return None
+
+        # a truncated or foreign cache file is ignored, the documents are parsed again
+        with open(self.cache_file, "rb") as file:
+            try:
+                header = marshal.load(file)
+            except (EOFError, ValueError, TypeError):
+                return None
+            if not isinstance(header, dict) or header.get("version") != CACHE_VERSION:
+                return None
+
+            stat = os.stat(self.documents_file)
+            touched = (header["mtime_ns"], header["size"]) != (stat.st_mtime_ns, stat.st_size)
+            # mtime changed - trust the cache only if the content is still the same
+            if touched and header["sha256"] != self._source_hash():
+                return None
+
+            try:
+                columns, missing = marshal.load(file)
+            except (EOFError, ValueError, TypeError):
+                return None
+
+        if touched:
+            self._write_cache(columns=(columns, missing), sha256=header["sha256"])
+
+        documents = [dict(zip(columns, row)) for row in zip(*columns.values())]
+        for field, rows in missing.items():  # fields absent from a document, not None-valued
+            for row in rows:
+                del documents[row][field]
+        return documents
+
+    def _write_cache(
+        self,
+        documents: list[dict[str, str]] | None = None,
+        columns: tuple[dict[str, list[str | None]], dict[str, list[int]]] | None = None,
+        sha256: str | None = None,
+    ) -> None:
+        """`columns` are the values of every field and the rows missing each field."""
+        if columns is None:
+            fields = list(dict.fromkeys(field for document in documents for field in document))
+            columns = (
+                {field: [document.get(field) for document in documents] for field in fields},
+                {
+                    field: [row for row, document in enumerate(documents) if field not in document]
+                    for field in fields
+                },
+            )
+
+        tmp_file = f"{self.cache_file}.tmp"
+        with open(tmp_file, "wb") as file:
+            marshal.dump(self._source_key(sha256), file)
+            marshal.dump(columns, file)
+        os.replace(tmp_file, self.cache_file)
@@ -0,0 +1,113 @@
+import hashlib
+import json
+import os
+from functools import cached_property, lru_cache
+
+import numpy as np
+from fastembed import TextEmbedding
+
+
+def content_hash(model_handle: str, text: str) -> str:
+    return hashlib.sha256(f"{model_handle}\n{text}".encode()).hexdigest()
+
+
+class EmbeddingStore:
+    """
+    Vectors keyed by content hash. With a `path` they are persisted as a raw float32 matrix
+    (`vectors.f32`, memory-mapped) and `keys.txt` with the hash of each row, both append-only,
+    so adding vectors only writes the new rows. Otherwise they're kept in memory.
+    """
+
+    VECTORS_FILE = "vectors.f32"
+    KEYS_FILE = "keys.txt"
+    META_FILE = "meta.json"
+
+    def __init__(self, path: str | None = None) -> None:
+        self.path = path
+        self.keys: dict[str, int] = {}
+        self.vectors: np.ndarray | None = None
+        self.dim: int | None = None
+
+        if path and os.path.exists(os.path.join(path, self.META_FILE)):
+            with open(os.path.join(path, self.META_FILE), "r") as file:
+                self.dim = json.load(file)["dim"]
+            if os.path.exists(os.path.join(path, self.KEYS_FILE)):
+                with open(os.path.join(path, self.KEYS_FILE), "r") as file:
+                    self.keys = {line.rstrip("\n"): row for row, line in enumerate(file)}
+            self._map_vectors()
+
+    def _map_vectors(self) -> None:
+        # rows written after the last complete add (no key yet) are ignored
+        if self.keys:
+            self.vectors = np.memmap(os.path.join(self.path, self.VECTORS_FILE), dtype=np.float32,
+                                     mode="r", shape=(len(self.keys), self.dim))
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.keys
+
+    def get_many(self, keys: list[str]) -> np.ndarray:
+        if not keys:
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+        return np.asarray(self.vectors[[self.keys[key] for key in keys]])
+
+    def add(self, keys: list[str], vectors: np.ndarray) -> None:
+        rows = len(self.keys)
+        vectors = np.asarray(vectors, dtype=np.float32)
+        self.dim = vectors.shape[1]
+
+        if self.path is None:
+            self.vectors = vectors if self.vectors is None else np.vstack([self.vectors, vectors])
+            self.keys.update({key: rows + i for i, key in enumerate(keys)})
+            return
+
+        os.makedirs(self.path, exist_ok=True)
+        if not rows:
+            with open(os.path.join(self.path, self.META_FILE), "w") as file:
+                json.dump({"dim": self.dim}, file)
+
+        vectors_file = os.path.join(self.path, self.VECTORS_FILE)
+        with open(vectors_file, "ab") as file:
+            file.truncate(rows * self.dim * 4)  # drop rows of an interrupted add
+            file.write(vectors.tobytes())
+        with open(os.path.join(self.path, self.KEYS_FILE), "a") as file:
+            file.writelines(f"{key}\n" for key in keys)
+
+        self.keys.update({key: rows + i for i, key in enumerate(keys)})
+        self._map_vectors()
+
+
+class Embedder:
+    """
+    Local fastembed embeddings: documents are embedded in batches and stored by content hash,
+    so unchanged documents are never embedded twice; query embeddings are kept in an LRU cache.
+    """
+
+    def __init__(
+        self,
+        model_handle: str,
+        cache_dir: str | None = None,
+        batch_size: int = 64,
+        query_cache_size: int = 1024,
+    ) -> None:
+        self.model_handle = model_handle
+        self.batch_size = batch_size
+        self.store = EmbeddingStore(cache_dir)
+        self.embed_query = lru_cache(maxsize=query_cache_size)(self._embed_query)
+
+    @cached_property
+    def model(self) -> TextEmbedding:
+        return TextEmbedding(model_name=self.model_handle)
+
+    def embed_documents(self, texts: list[str]) -> np.ndarray:
+        keys = [content_hash(self.model_handle, text) for text in texts]
+        missing = {key: text for key, text in zip(keys, texts) if key not in self.store}
+        if missing:
+            vectors = list(self.model.embed(list(missing.values()), batch_size=self.batch_size))
+            self.store.add(list(missing), np.array(vectors))
+            print(f"Embedded {len(missing)} new documents, {len(keys) - len(missing)} taken from the cache")
+        return self.store.get_many(keys)
+
+    def _embed_query(self, query: str) -> np.ndarray:
+        vector = np.asarray(next(iter(self.model.query_embed(query))), dtype=np.float32)
+        vector.setflags(write=False)  # shared by all cache hits
+        return vector
@@ -1,18 +1,176 @@
+import asyncio
+import time
+from collections.abc import AsyncIterator, Iterator
+from dataclasses import dataclass
+
+import httpx
 from ollama import chat
+from ollama import AsyncClient
 from ollama import ChatResponse
+from response_cache import ResponseCache
+from tracing import add_span, record_llm_response, span
+
+
+@dataclass
+class StreamMetrics:
+    time_to_first_token: float | None = None
+    total_time: float | None = None
+    chunks: int = 0
+    prompt_eval_count: int | None = None
+    eval_count: int | None = None
+    tokens_per_second: float | None = None
+
+    def update(self, chunk: ChatResponse, start: float) -> None:
+        if chunk.message.content:
+            if self.time_to_first_token is None:
+                self.time_to_first_token = time.perf_counter() - start
+            self.chunks += 1
+        if chunk.done:
+            self.prompt_eval_count = chunk.prompt_eval_count
+            self.eval_count = chunk.eval_count
+            if chunk.eval_count and chunk.eval_duration:
+                self.tokens_per_second = chunk.eval_count / (chunk.eval_duration / 1e9)
+
+    def finish(self, start: float) -> None:
+        self.total_time = time.perf_counter() - start
+        # fallback when the server doesn't report eval stats - one chunk is one token,
+        # the first chunk arrived at time_to_first_token, so it isn't generated in the interval after it
+        if self.tokens_per_second is None and self.time_to_first_token is not None and self.chunks >= 2:
+            generation_time = self.total_time - self.time_to_first_token
+            self.tokens_per_second = (self.chunks - 1) / generation_time if generation_time > 0 else None
+
+    def __str__(self) -> str:
+        ttft = f"{self.time_to_first_token:.2f}s" if self.time_to_first_token is not None else "-"
+        tps = f"{self.tokens_per_second:.1f}" if self.tokens_per_second is not None else "-"
+        return f"time to first token: {ttft}, tokens/s: {tps}, total: {self.total_time:.2f}s"
 
 
 class Llm:
 
-    def __init__(self, model: str):
+    def __init__(self, model: str, cache: ResponseCache | None = None):
         self.model = model
+        self.cache = cache
+
+    def get_chat_esponse(
+        self,
+        prompt_template: str,
+        query: str | None = None,
+        context: list[dict[str, str]] | None = None,
+    ) -> str:
+        """`query` and `context` (retrieved documents) enable the semantic tier of the response cache."""
+        with span("llm.chat", model=self.model) as chat_span:
+            if self.cache is not None:
+                cached = self.cache.get(self.model, prompt_template, query=query, context=context)
+                chat_span.attributes["cached"] = cached is not None
+                if cached is not None:
+                    return cached
+
+            response: ChatResponse = chat(model=self.model, messages=[
+                {
+                    'role': 'user',
+                    'content': prompt_template,
+                },
+            ])
+            record_llm_response(chat_span, response)
+
+        if self.cache is not None:
+            self.cache.put(self.model, prompt_template, response.message.content, query=query, context=context)
+        return response.message.content
+
+    def stream_chat_response(self, prompt_template: str, metrics: StreamMetrics | None = None) -> Iterator[str]:
+        """
+        Yield response tokens as they arrive. Metrics of the call are filled into `metrics` (if passed),
+        they're complete when the stream ends or is closed early.
+        """
+        start = time.perf_counter()
+        metrics = metrics if metrics is not None else StreamMetrics()
+        try:
+            for chunk in chat(model=self.model, messages=[
+                {
+                    'role': 'user',
+                    'content': prompt_template,
+                },
+            ], stream=True):
+                metrics.update(chunk, start)
+                if chunk.message.content:
+                    yield chunk.message.content
+        finally:
+            metrics.finish(start)
+            add_span(
+                "llm.stream", start, model=self.model, time_to_first_token=metrics.time_to_first_token,
+                prompt_eval_count=metrics.prompt_eval_count, eval_count=metrics.eval_count
+            )
 
-    def get_chat_esponse(self, prompt_template: str) -> str:
-        response: ChatResponse = chat(model=self.model, messages=[
+
+class AsyncLlm:
+    """
+    Async Llm sharing one AsyncClient (pooled keep-alive connections) between all requests,
+    with at most `max_concurrency` requests in flight. Use it within a single event loop.
+    """
+
+    def __init__(self, model: str, host: str | None = None, max_concurrency: int = 4):
+        self.model = model
+        # the transport is ours, so it can be closed (ollama's AsyncClient has no close());
+        # requests are limited by the semaphore, streams still being read keep their connection
+        self.transport = httpx.AsyncHTTPTransport(
+            limits=httpx.Limits(max_connections=None, max_keepalive_connections=max_concurrency)
+        )
+        self.client = AsyncClient(host=host, transport=self.transport)
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def __aenter__(self) -> "AsyncLlm":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+    async def get_chat_esponse(self, prompt_template: str) -> str:
+        async with self.semaphore:
+            with span("llm.chat", model=self.model) as chat_span:
+                response: ChatResponse = await self.client.chat(model=self.model, messages=[
+                    {
+                        'role': 'user',
+                        'content': prompt_template,
+                    },
+                ])
+                record_llm_response(chat_span, response)
+        return response.message.content
+
+    async def stream_chat_response(
+        self, prompt_template: str, metrics: StreamMetrics | None = None
+    ) -> AsyncIterator[str]:
+        """
+        Yield response tokens as they arrive. Metrics of the call are filled into `metrics` (if passed),
+        they're complete when the stream ends or is closed early.
+        """
+        start = time.perf_counter()
+        metrics = metrics if metrics is not None else StreamMetrics()
+        chunks = await self.client.chat(model=self.model, messages=[
             {
                 'role': 'user',
                 'content': prompt_template,
             },
-        ])
-        return response.message.content
+        ], stream=True)
+        try:
+            # the request is sent with the first chunk, a slow consumer doesn't hold the semaphore
+            async with self.semaphore:
+                chunk = await anext(chunks, None)
+            while chunk is not None:
+                metrics.update(chunk, start)
+                if chunk.message.content:
+                    yield chunk.message.content
+                chunk = await anext(chunks, None)
+        finally:
+            await chunks.aclose()
+            metrics.finish(start)
+            add_span(
+                "llm.stream", start, model=self.model, time_to_first_token=metrics.time_to_first_token,
+                prompt_eval_count=metrics.prompt_eval_count, eval_count=metrics.eval_count
+            )
 
+    async def gather_responses(self, prompts: list[str]) -> list[str]:
+        """Answer all prompts concurrently, responses are returned in the order of prompts."""
+        return await asyncio.gather(*(self.get_chat_esponse(prompt) for prompt in prompts))
@@ -1,14 +1,117 @@
-from dataclasses import dataclass
+import re
+from collections.abc import Callable
+from dataclasses import dataclass, field
+
+from tracing import span
+
+# words are split in pieces of up to 6 characters to approximate BPE tokenizers
+TOKEN_PATTERN = re.compile(r"\w{1,6}|[^\w\s]")
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+|\n+")
+WORD_PATTERN = re.compile(r"\w{3,}")
+
+# the prompt compiled once into static segments around the query and the context; the instructions come
+# first, so Ollama reuses their KV cache between queries. Kept byte-identical to the former f-string
+# (including its indentation), so the response cache stays valid.
+PROMPT_PREFIX = (
+    'Answer the question based on the aswers provided.\n'
+    '          If the question cannot be answered based on the context, say "I don\'t know".\n\n'
+    '          Question: '
+)
+PROMPT_ANSWER = "\n\n          Answer: "
+
+
+def count_tokens(text: str) -> int:
+    """Fast local estimate of the number of LLM tokens in the text."""
+    return len(TOKEN_PATTERN.findall(text))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, token_counter: Callable[[str], int] = count_tokens) -> str:
+    """Longest prefix of the text within max_tokens (binary search, so any token counter works)."""
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if token_counter(text[:middle]) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low]
+
+
+def trim_to_relevant(text: str, query: str, max_tokens: int, token_counter: Callable[[str], int] = count_tokens) -> str:
+    """Keep the sentences sharing most words with the query (in their original order) within max_tokens."""
+    if token_counter(text) <= max_tokens:
+        return text
+
+    sentences = [sentence for sentence in SENTENCE_PATTERN.split(text) if sentence.strip()]
+    query_words = set(WORD_PATTERN.findall(query.lower()))
+
+    def overlap(i: int) -> int:
+        return len(query_words.intersection(WORD_PATTERN.findall(sentences[i].lower())))
+
+    ranked = sorted(range(len(sentences)), key=lambda i: (-overlap(i), i))
+    kept = []
+    used = 0
+    for i in ranked:
+        tokens = token_counter(sentences[i])
+        if used + tokens <= max_tokens:
+            kept.append(i)
+            used += tokens
+    if not kept:  # even the most relevant sentence is over the budget
+        return truncate_to_tokens(sentences[ranked[0]], max_tokens, token_counter).rstrip()
+    return " ".join(sentences[i] for i in sorted(kept))
+
+
+@dataclass
+class PromptStats:
+    prompt_tokens: int = 0
+    context_tokens: int = 0
+    documents_included: int = 0
+    documents_trimmed: int = 0
+    documents_total: int = 0
+
 
 @dataclass
 class PromptTemplate:
+    """
+    With `max_context_tokens` the highest-ranked documents are packed into the budget and answers longer
+    than `max_document_tokens` are trimmed to the sentences most relevant to the query.
+    Prompt size of the last rendering is in `stats`. Only the query and the context are rendered,
+    the instructions are the precompiled PROMPT_PREFIX.
+    """
     query: str
     search_result: list[dict[str, str]]
-    
+    max_context_tokens: int | None = None
+    max_document_tokens: int | None = None
+    token_counter: Callable[[str], int] = count_tokens
+    stats: PromptStats = field(default_factory=PromptStats, init=False, repr=False)
+
+    def _context(self) -> str:
+        self.stats = PromptStats(documents_total=len(self.search_result))
+        sections = []
+        for el in self.search_result:  # search results are ordered by rank
+            text = el["text"]
+            if self.max_document_tokens is not None:
+                text = trim_to_relevant(text, self.query, self.max_document_tokens, self.token_counter)
+            section = f'section: {el["section"]}, question: {el["question"]}, text: {text}'
+
+            tokens = self.token_counter(section)
+            if self.max_context_tokens is not None and self.stats.context_tokens + tokens > self.max_context_tokens:
+                continue
+            self.stats.context_tokens += tokens
+            self.stats.documents_included += 1
+            self.stats.documents_trimmed += text != el["text"]
+            sections.append(section)
+        return ",\n\n".join(sections)
+
     def __str__(self) -> str:
-        return f"""
-          Answer the question based on the aswers provided.
-          If the question cannot be answered based on the context, say "I don't know".\n
-          Question: {self.query}\n
-          Answer: {",\n\n".join([f'section: {el["section"]}, question: {el["question"]}, text: {el["text"]}' for el in self.search_result])}
-        """.strip()
+        with span("prompt.render") as render_span:
+            prompt = self._render()
+            render_span.attributes.update(
+                prompt_tokens=self.stats.prompt_tokens, documents_included=self.stats.documents_included
+            )
+        return prompt
+
+    def _render(self) -> str:
+        prompt = (PROMPT_PREFIX + self.query + PROMPT_ANSWER + self._context()).rstrip()
+        self.stats.prompt_tokens = self.token_counter(prompt)
+        return prompt
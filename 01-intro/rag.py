@@ -1,16 +1,20 @@
+from collections.abc import Iterator
+from functools import cache
 
-from prompt_template import PromptTemplate
 from document_parser import DocumentParser
 from search_engine import ElasticSearchEngine
 from llm import Llm
+from response_cache import ResponseCache
+from rag_pipeline import RagPipeline
 
 MODEL = 'llama3.1:8b'
+RESPONSE_CACHE_FILE = "data/response_cache.sqlite"
+MAX_CONTEXT_TOKENS = 2000
+MAX_DOCUMENT_TOKENS = 400
 q = "how many zoomcamp is enrolled in a year?"
 
-def rag(query):
-    document_parser = DocumentParser("data/documents.json")
-    index_name = "course-questions"
-    search_query = {
+def build_search_query(query) -> dict:
+    return {
         "size": 5,
         "query": {
             "bool": {
@@ -30,19 +34,28 @@ def rag(query):
         }
     }
 
+@cache
+def get_pipeline() -> RagPipeline:
+    """Parse documents, index them and create the LLM client once per process."""
+    document_parser = DocumentParser("data/documents.json")
+    index_name = "course-questions"
     elastic_search_engine = ElasticSearchEngine(document_parser.parsed_documents, index_name=index_name)
-    results = elastic_search_engine.search(search_query)
 
-
-
-    prompt_template = PromptTemplate(
-        query=query,
-        search_result=results
+    return RagPipeline(
+        engine=elastic_search_engine,
+        llm=Llm(model=MODEL, cache=ResponseCache(RESPONSE_CACHE_FILE)),
+        query_builder=build_search_query,
+        max_context_tokens=MAX_CONTEXT_TOKENS,
+        max_document_tokens=MAX_DOCUMENT_TOKENS
     )
 
-    llm = Llm(model=MODEL)
-    response = llm.get_chat_esponse(prompt_template=str(prompt_template))
-    
-    return response
+def rag(query):
+    answer, _ = get_pipeline().answer(query)
+    return answer
+
+def rag_stream(query) -> Iterator[str]:
+    """Same as rag, but yields the response tokens as they are generated."""
+    pipeline = get_pipeline()
+    yield from pipeline.answer_stream_verbose(query)
 
-print(rag(q)) # Example usage of the rag function
\ No newline at end of file
+print(rag(q)) # Example usage of the rag function
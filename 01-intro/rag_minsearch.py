@@ -1,36 +1,61 @@
+import os
+from collections.abc import Iterator
+from functools import cache
+
 from minsearch.minsearch import Index
-from prompt_template import PromptTemplate
 from document_parser import DocumentParser
 from search_engine import MiniSearchEngine
 from llm import Llm
+from response_cache import ResponseCache
+from rag_pipeline import RagPipeline
 
 MODEL = 'llama3.1:8b'
+RESPONSE_CACHE_FILE = "data/response_cache.sqlite"
+MAX_CONTEXT_TOKENS = 2000
+MAX_DOCUMENT_TOKENS = 400
+DOCUMENTS_FILE = "data/documents.json"
+SNAPSHOT_DIR = "data/minsearch_snapshot"
 q = "How do I run kafka?"
 
-def rag(query):
-    document_parser = DocumentParser("data/documents.json")
+def load_search_engine() -> MiniSearchEngine:
+    """Load the index snapshot, (re)building it when missing, unreadable or older than the documents file."""
+    snapshot_file = os.path.join(SNAPSHOT_DIR, MiniSearchEngine.SNAPSHOT_STATE_FILE)
+    if os.path.exists(snapshot_file) and os.path.getmtime(snapshot_file) >= os.path.getmtime(DOCUMENTS_FILE):
+        search_engine = MiniSearchEngine.load(SNAPSHOT_DIR, index_cls=Index)
+        if search_engine is not None:
+            return search_engine
+
+    document_parser = DocumentParser(DOCUMENTS_FILE)
     index = Index(
         text_fields=["text", "question", "section"],
         keyword_fields=["course"],
     )
-
     search_engine = MiniSearchEngine(index=index, documents=document_parser.parsed_documents)
-    results = search_engine.search(
-        query=q,
-        boost_dict={"question": 3, "section": 0.5},
-        filter_dict={"course": "data-engineering-zoomcamp"},
-        num_result=5
-    )
-
+    search_engine.save(SNAPSHOT_DIR)
+    return search_engine
 
-    prompt_template = PromptTemplate(
-        query=query,
-        search_result=results
+@cache
+def get_pipeline() -> RagPipeline:
+    """Load the index and create the LLM client once per process."""
+    return RagPipeline(
+        engine=load_search_engine(),
+        llm=Llm(model=MODEL, cache=ResponseCache(RESPONSE_CACHE_FILE)),
+        search_kwargs={
+            "boost_dict": {"question": 3, "section": 0.5},
+            "filter_dict": {"course": "data-engineering-zoomcamp"},
+            "num_result": 5
+        },
+        max_context_tokens=MAX_CONTEXT_TOKENS,
+        max_document_tokens=MAX_DOCUMENT_TOKENS
     )
 
-    llm = Llm(model=MODEL)
-    response = llm.get_chat_esponse(prompt_template=str(prompt_template))
-    
-    return response
+def rag(query):
+    answer, _ = get_pipeline().answer(query)
+    return answer
+
+def rag_stream(query) -> Iterator[str]:
+    """Same as rag, but yields the response tokens as they are generated."""
+    pipeline = get_pipeline()
+    yield from pipeline.answer_stream_verbose(query)
 
-print(rag(q))  # Example usage of the rag function
\ No newline at end of file
+print(rag(q))  # Example usage of the rag function
@@ -0,0 +1,112 @@
+import contextvars
+from collections.abc import Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any
+
+from llm import Llm, StreamMetrics
+from prompt_template import PromptStats, PromptTemplate
+from search_engine import SearchEngine
+from tracing import trace
+
+
+@dataclass
+class AnswerStats:
+    """Size of the prompt of one answer and, for streamed answers, the generation metrics."""
+    prompt: PromptStats | None = None
+    stream: StreamMetrics | None = None
+
+    def __str__(self) -> str:
+        parts = []
+        if self.prompt is not None:
+            parts.append(f"prompt tokens: {self.prompt.prompt_tokens}")
+        if self.stream is not None and self.stream.total_time is not None:
+            parts.append(str(self.stream))
+        return ", ".join(parts)
+
+
+class RagPipeline:
+    """
+    Owns the search engine and the LLM, so documents are parsed and indexed once
+    and every query only pays for retrieval and generation.
+
+    `search_kwargs` are passed to `engine.search`, `query_builder` turns the question
+    into the engine query (e.g. an Elasticsearch query body). Token budgets are passed
+    to `PromptTemplate`, the size of the prompt is returned with every answer (`AnswerStats`).
+    Every answer is a trace ("rag.answer") with spans of retrieval, prompt rendering and generation.
+    """
+
+    def __init__(
+        self,
+        engine: SearchEngine,
+        llm: Llm,
+        search_kwargs: dict[str, Any] | None = None,
+        query_builder: Callable[[str], Any] | None = None,
+        max_workers: int = 4,
+        max_context_tokens: int | None = None,
+        max_document_tokens: int | None = None,
+    ) -> None:
+        self.engine = engine
+        self.llm = llm
+        self.search_kwargs = search_kwargs or {}
+        self.query_builder = query_builder
+        self.max_workers = max_workers
+        self.max_context_tokens = max_context_tokens
+        self.max_document_tokens = max_document_tokens
+
+    def retrieve(self, query: str) -> list[dict[str, str]]:
+        search_query = self.query_builder(query) if self.query_builder else query
+        return self.engine.search(search_query, **self.search_kwargs)
+
+    def build_prompt(self, query: str) -> PromptTemplate:
+        return PromptTemplate(
+            query=query,
+            search_result=self.retrieve(query),
+            max_context_tokens=self.max_context_tokens,
+            max_document_tokens=self.max_document_tokens
+        )
+
+    def answer(self, query: str) -> tuple[str, AnswerStats]:
+        with trace("rag.answer", query=query):
+            prompt_template = self.build_prompt(query)
+            prompt = str(prompt_template)
+            answer = self.llm.get_chat_esponse(
+                prompt_template=prompt,
+                query=prompt_template.query,
+                context=prompt_template.search_result
+            )
+            return answer, AnswerStats(prompt=prompt_template.stats)
+
+    def answer_stream(self, query: str, stats: AnswerStats | None = None) -> Iterator[str]:
+        """Yield the response tokens, the size of the prompt and generation metrics are filled into `stats`."""
+        # the generator runs in its own context, so the trace isn't visible to the caller between tokens
+        context = contextvars.copy_context()
+        tokens = self._answer_stream(query, stats if stats is not None else AnswerStats())
+        try:
+            while True:
+                try:
+                    token = context.run(next, tokens)
+                except StopIteration:
+                    return
+                yield token
+        finally:
+            context.run(tokens.close)
+
+    def _answer_stream(self, query: str, stats: AnswerStats) -> Iterator[str]:
+        with trace("rag.answer_stream", query=query):
+            prompt_template = self.build_prompt(query)
+            prompt = str(prompt_template)
+            stats.prompt = prompt_template.stats
+            stats.stream = stats.stream or StreamMetrics()
+            yield from self.llm.stream_chat_response(prompt_template=prompt, metrics=stats.stream)
+
+    def answer_stream_verbose(self, query: str) -> Iterator[str]:
+        """`answer_stream`, printing the stats of the answer after the last token."""
+        stats = AnswerStats()
+        yield from self.answer_stream(query, stats)
+        print(f"\n[{stats}]")
+
+    def answer_many(self, queries: list[str]) -> list[tuple[str, AnswerStats]]:
+        """Answer queries concurrently (retrieval and generation overlap), in the order of queries."""
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(self.answer, queries))
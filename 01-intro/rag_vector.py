@@ -1,32 +1,54 @@
+from collections.abc import Iterator
+from functools import cache
 
-from prompt_template import PromptTemplate
 from document_parser import DocumentParser
 from search_engine import VectorSearchEngine
+from embeddings import Embedder
 from llm import Llm
+from response_cache import ResponseCache
+from rag_pipeline import RagPipeline
 
 MODEL = 'llama3.1:8b'
+RESPONSE_CACHE_FILE = "data/response_cache.sqlite"
+MAX_CONTEXT_TOKENS = 2000
+MAX_DOCUMENT_TOKENS = 400
+EMBEDDING_MODEL = "jinaai/jina-embeddings-v2-small-en"
 q = "how many zoomcamp is enrolled in a year?"
 
-def rag(query, create_collection: bool = False) -> str:
+@cache
+def get_pipeline() -> RagPipeline:
+    """Parse documents, connect to Qdrant and create the LLM client once per process."""
     document_parser = DocumentParser("data/documents.json")
+    embedder = Embedder(EMBEDDING_MODEL, cache_dir="data/embeddings.cache")
     engine = VectorSearchEngine(
         documents=document_parser.parsed_documents,
-        model_handle="jinaai/jina-embeddings-v2-small-en",
+        model_handle=EMBEDDING_MODEL,
         collection_name="zoomcamp-rag",
+        embedder=embedder,
     )
-    if create_collection:
-        engine.crete_collection()
-    engine.create_payload_index(field_name="course")
-    results = engine.search(query=query, filter_field="course", filter_value="data-engineering-zoomcamp", num_result=5)
 
-    prompt_template = PromptTemplate(
-        query=query,
-        search_result=results
+    return RagPipeline(
+        engine=engine,
+        llm=Llm(model=MODEL, cache=ResponseCache(RESPONSE_CACHE_FILE, embed=embedder.embed_query)),
+        search_kwargs={"filter_field": "course", "filter_value": "data-engineering-zoomcamp", "num_result": 5},
+        max_context_tokens=MAX_CONTEXT_TOKENS,
+        max_document_tokens=MAX_DOCUMENT_TOKENS
     )
 
-    llm = Llm(model=MODEL)
-    response = llm.get_chat_esponse(prompt_template=str(prompt_template))
-    
-    return response
+def get_collection_pipeline(create_collection: bool = False) -> RagPipeline:
+    pipeline = get_pipeline()
+    if create_collection:
+        pipeline.engine.crete_collection()
+        pipeline.engine.create_payload_index(field_name="course")
+    return pipeline
+
+def rag(query, create_collection: bool = False) -> str:
+    answer, _ = get_collection_pipeline(create_collection).answer(query)
+    return answer
+
+def rag_stream(query, create_collection: bool = False) -> Iterator[str]:
+    """Same as rag, but yields the response tokens as they are generated."""
+    pipeline = get_collection_pipeline(create_collection)
+    yield from pipeline.answer_stream_verbose(query)
 
-print(rag(q)) # Example usage of the rag function
\ No newline at end of file
+print(rag(q)) # Example usage of the rag function
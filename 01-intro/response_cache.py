@@ -0,0 +1,160 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections.abc import Callable
+
+import numpy as np
+
+
+class ResponseCache:
+    """
+    SQLite-backed cache of LLM responses with TTL and LRU eviction.
+
+    Exact tier: keyed by (model, normalized prompt) hash.
+    Semantic tier (when `embed` is given): reuses the answer of a cached query whose embedding is within
+    `similarity_threshold` cosine similarity, for the same model and the same retrieved context.
+    """
+
+    def __init__(
+        self,
+        path: str = ":memory:",
+        ttl: float | None = 24 * 3600,
+        max_entries: int = 10_000,
+        embed: Callable[[str], np.ndarray] | None = None,
+        similarity_threshold: float = 0.95,
+    ) -> None:
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.embed = embed
+        self.similarity_threshold = similarity_threshold
+        self.stats = {"hits": 0, "semantic_hits": 0, "misses": 0}
+
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                context_hash TEXT,
+                embedding BLOB,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_context ON responses (model, context_hash)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+        self.conn.commit()
+
+    @staticmethod
+    def normalize(prompt: str) -> str:
+        return " ".join(prompt.lower().split())
+
+    def _key(self, model: str, prompt: str) -> str:
+        return hashlib.sha256(f"{model}\n{self.normalize(prompt)}".encode()).hexdigest()
+
+    @staticmethod
+    def _context_hash(context: list[dict[str, str]] | None) -> str | None:
+        if context is None:
+            return None
+        return hashlib.sha256(json.dumps(context, sort_keys=True).encode()).hexdigest()
+
+    def _query_embedding(self, query: str | None) -> np.ndarray | None:
+        if self.embed is None or query is None:
+            return None
+        embedding = np.asarray(self.embed(self.normalize(query)), dtype=np.float32)
+        return embedding / (np.linalg.norm(embedding) or 1)
+
+    def get(
+        self,
+        model: str,
+        prompt: str,
+        query: str | None = None,
+        context: list[dict[str, str]] | None = None,
+    ) -> str | None:
+        now = time.time()
+        min_created_at = now - self.ttl if self.ttl is not None else 0
+
+        key = self._key(model, prompt)
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT response FROM responses WHERE key = ? AND created_at >= ?", (key, min_created_at)
+            ).fetchone()
+
+        if row is not None:
+            self.stats["hits"] += 1
+        else:
+            embedding = self._query_embedding(query)  # computed only on exact-tier misses
+            if embedding is not None:
+                with self.lock:
+                    key, row = self._semantic_lookup(model, self._context_hash(context), embedding, min_created_at)
+                if row is not None:
+                    self.stats["semantic_hits"] += 1
+
+        if row is None:
+            self.stats["misses"] += 1
+            return None
+
+        with self.lock:
+            self.conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self.conn.commit()
+        return row[0]
+
+    def _semantic_lookup(
+        self,
+        model: str,
+        context_hash: str | None,
+        embedding: np.ndarray,
+        min_created_at: float,
+    ) -> tuple[str | None, tuple[str] | None]:
+        rows = self.conn.execute(
+            "SELECT key, embedding, response FROM responses "
+            "WHERE model = ? AND context_hash IS ? AND embedding IS NOT NULL AND created_at >= ?",
+            (model, context_hash, min_created_at),
+        ).fetchall()
+        if not rows:
+            return None, None
+
+        similarities = np.frombuffer(b"".join(row[1] for row in rows), dtype=np.float32)
+        similarities = similarities.reshape(len(rows), -1) @ embedding
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.similarity_threshold:
+            return None, None
+        return rows[best][0], (rows[best][2],)
+
+    def put(
+        self,
+        model: str,
+        prompt: str,
+        response: str,
+        query: str | None = None,
+        context: list[dict[str, str]] | None = None,
+    ) -> None:
+        now = time.time()
+        embedding = self._query_embedding(query)
+
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    self._key(model, prompt),
+                    model,
+                    self._context_hash(context),
+                    embedding.tobytes() if embedding is not None else None,
+                    response,
+                    now,
+                    now,
+                ),
+            )
+            if self.ttl is not None:
+                self.conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+            # LRU eviction
+            self.conn.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self.conn.commit()
@@ -1,9 +1,22 @@
+import contextvars
+import hashlib
+import json
+import os
+import pickle
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from minsearch.minsearch import Index
+from scipy.sparse import csr_matrix
+from sklearn.preprocessing import normalize
 from elasticsearch import Elasticsearch
+from elasticsearch.helpers import parallel_bulk
 from functools import cached_property
 from tqdm.auto import tqdm
 from typing import Protocol
 from qdrant_client import QdrantClient, models
+from embeddings import Embedder
+from tracing import traced
 
 
 class SearchEngine(Protocol):
@@ -12,11 +25,84 @@ class SearchEngine(Protocol):
         pass
 
 
+def corpus_hash(documents: list[dict[str, str]]) -> str:
+    """Content hash of the whole corpus, used to skip re-indexing unchanged documents."""
+    return hashlib.sha256(json.dumps(documents, sort_keys=True).encode()).hexdigest()
+
+
 class MiniSearchEngine:
-    def __init__(self, index: Index, documents: list[dict[str, str]]) -> None:
+    """
+    Pass documents to fit the index, or skip them when the index is already fitted (e.g. loaded from a snapshot).
+    """
+
+    SNAPSHOT_STATE_FILE = "index.pkl"
+    SNAPSHOT_VERSION = 2  # bump when the snapshot layout or the search code relying on it changes
+
+    def __init__(self, index: Index, documents: list[dict[str, str]] | None = None) -> None:
         self.index = index
-        self.index.fit(documents)
+        if documents is not None:
+            self.index.fit(documents)
+
+    def save(self, path: str) -> None:
+        """
+        Save the fitted index to the `path` directory.
+        TF-IDF matrices are stored as raw CSR arrays (.npy) so they can be memory-mapped on load,
+        the rest of the index state (vectorizers with vocabulary, keyword fields, docs) is pickled.
+        """
+        os.makedirs(path, exist_ok=True)
+        state = vars(self.index).copy()
+        shapes = {}
+        for field, matrix in state.pop("text_matrices", {}).items():
+            matrix = csr_matrix(matrix)
+            for name in ("data", "indices", "indptr"):
+                np.save(os.path.join(path, f"{field}.{name}.npy"), getattr(matrix, name))
+            shapes[field] = matrix.shape
 
+        with open(os.path.join(path, self.SNAPSHOT_STATE_FILE), "wb") as file:
+            pickle.dump(
+                {"version": self.SNAPSHOT_VERSION, "cls": type(self.index), "state": state, "shapes": shapes},
+                file,
+                protocol=5,
+            )
+
+    @classmethod
+    def load(cls, path: str, index_cls: type = Index, mmap: bool = True) -> "MiniSearchEngine | None":
+        """
+        Load an index saved with `save`, memory-mapping the TF-IDF matrices so processes share the pages.
+        Returns None when there is no snapshot, it can't be read, or it has another format version
+        or index class - rebuild it then.
+        """
+        snapshot_file = os.path.join(path, cls.SNAPSHOT_STATE_FILE)
+        if not os.path.exists(snapshot_file):
+            return None
+        with open(snapshot_file, "rb") as file:
+            try:
+                snapshot = pickle.load(file)
+            except (pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+                return None
+        if (
+            not isinstance(snapshot, dict)
+            or snapshot.get("version") != cls.SNAPSHOT_VERSION
+            or snapshot.get("cls") is not index_cls
+        ):
+            return None
+
+        index = snapshot["cls"].__new__(snapshot["cls"])
+        index.__dict__.update(snapshot["state"])
+        if snapshot["shapes"]:
+            mmap_mode = "r" if mmap else None
+            index.text_matrices = {
+                field: csr_matrix(
+                    tuple(np.load(os.path.join(path, f"{field}.{name}.npy"), mmap_mode=mmap_mode)
+                          for name in ("data", "indices", "indptr")),
+                    shape=shape,
+                    copy=False,
+                )
+                for field, shape in snapshot["shapes"].items()
+            }
+        return cls(index)
+
+    @traced("search.minsearch")
     def search(self, 
             query: str, 
             boost_dict: dict[str, int | float], 
@@ -31,16 +117,72 @@ class MiniSearchEngine:
         )
         return results
 
+    @traced("search.minsearch.many")
+    def search_many(self,
+            queries: list[str],
+            boost_dict: dict[str, int | float],
+            filter_dict: dict[str, str],
+            num_result: int = 5
+        ) -> list[list[dict[str, str]]]:
+        """
+        Search several queries at once. With a TF-IDF `Index` all queries are vectorized into one sparse
+        matrix per field and scored with a single matrix product, other indexes run one search per query.
+        """
+        if not hasattr(self.index, "text_matrices"):
+            return [self.search(query, boost_dict, filter_dict, num_result) for query in queries]
+        if not queries or not self.index.docs:
+            return [[] for _ in queries]
+
+        scores = np.zeros((len(queries), len(self.index.docs)))
+        for field in self.index.text_fields:
+            query_matrix = normalize(self.index.vectorizers[field].transform(queries))
+            # TfidfVectorizer rows are L2-normalized, so the dot product is the cosine similarity
+            scores += (query_matrix @ self.index.text_matrices[field].T).toarray() * boost_dict.get(field, 1)
+
+        for field, value in filter_dict.items():
+            if field in self.index.keyword_fields:
+                scores *= (self.index.keyword_df[field] == value).to_numpy()
+
+        return [self._top_documents(query_scores, num_result) for query_scores in scores]
+
+    def _top_documents(self, scores: np.ndarray, num_result: int) -> list[dict[str, str]]:
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > num_result:
+            candidates = candidates[np.argpartition(-scores[candidates], num_result - 1)[:num_result]]
+        top = candidates[np.argsort(-scores[candidates])]
+        return [self.index.docs[i] for i in top]
+
 
 class ElasticSearchEngine:
-    def __init__(self, documents: list[dict[str, str]], index_name: str) -> None:
+    """
+    The index is (re)built with parallel `_bulk` requests only if it doesn't exist yet
+    or was built from a different corpus (hash stored in the mapping `_meta`).
+    """
+
+    def __init__(
+        self,
+        documents: list[dict[str, str]],
+        index_name: str,
+        host: str = "http://localhost:9200",
+        batch_size: int = 500,
+        workers: int = 4,
+        force_reindex: bool = False,
+    ) -> None:
         self.documents = documents
         self.index_name = index_name
+        self.host = host
+        self.batch_size = batch_size
+        self.workers = workers
+        self.force_reindex = force_reindex
         self._create_index()
 
     @cached_property
     def es_client(self):
-        return Elasticsearch("http://localhost:9200")
+        return Elasticsearch(self.host)
+
+    @cached_property
+    def corpus_hash(self) -> str:
+        return corpus_hash(self.documents)
     
     @cached_property
     def index_settings(self):
@@ -59,16 +201,52 @@ class ElasticSearchEngine:
                 }
             }
         }
+
+    def _is_up_to_date(self) -> bool:
+        if not self.es_client.indices.exists(index=self.index_name):
+            return False
+        mapping = self.es_client.indices.get_mapping(index=self.index_name)
+        meta = mapping[self.index_name]["mappings"].get("_meta", {})
+        return meta.get("corpus_hash") == self.corpus_hash
     
     def _create_index(self):
+        if not self.force_reindex and self._is_up_to_date():
+            print(f"Index '{self.index_name}' is up to date, skipping indexing")
+            return
+
         if self.es_client.indices.exists(index=self.index_name):
             self.es_client.indices.delete(index=self.index_name)
         
         self.es_client.indices.create(index=self.index_name, body=self.index_settings)
-        
-        for doc in tqdm(self.documents):
-            self.es_client.index(index=self.index_name, document=doc)
+        self._bulk_index()
+        # mark the index as complete only after all documents are indexed
+        self.es_client.indices.put_mapping(index=self.index_name, meta={"corpus_hash": self.corpus_hash})
+
+    def _bulk_index(self):
+        actions = ({"_index": self.index_name, "_source": doc} for doc in self.documents)
+
+        # no refreshes during the load, one refresh at the end
+        self.es_client.indices.put_settings(index=self.index_name, settings={"refresh_interval": "-1"})
+        start = time.perf_counter()
+        try:
+            results = parallel_bulk(
+                self.es_client,
+                actions,
+                thread_count=self.workers,
+                chunk_size=self.batch_size,
+            )
+            for ok, info in tqdm(results, total=len(self.documents)):
+                if not ok:
+                    raise RuntimeError(f"Failed to index document: {info}")
+        finally:
+            self.es_client.indices.put_settings(index=self.index_name, settings={"refresh_interval": None})
+            self.es_client.indices.refresh(index=self.index_name)
 
+        elapsed = time.perf_counter() - start
+        print(f"Indexed {len(self.documents)} documents in {elapsed:.2f}s "
+              f"({len(self.documents) / elapsed:.0f} docs/s, batch_size={self.batch_size}, workers={self.workers})")
+
+    @traced("search.elasticsearch")
     def search(self, query: str) -> list[dict[str, str]]:
         response = self.es_client.search(index=self.index_name, body=query)
         return [hit['_source'] for hit in response['hits']['hits']]
@@ -78,14 +256,26 @@ class VectorSearchEngine:
 
     EMBEDDING_DIMENSIONALITY = 512
 
-    def __init__(self, documents: list[dict[str, str]], model_handle: str, collection_name: str) -> None:
+    def __init__(
+        self,
+        documents: list[dict[str, str]],
+        model_handle: str,
+        collection_name: str,
+        location: str = "http://localhost:6333",
+        embedder: Embedder | None = None,
+        batch_size: int = 64,
+    ) -> None:
+        """location can be a Qdrant url or ":memory:" for a local in-process instance"""
         self.documents = documents
         self.model_handle = model_handle
         self.collection_name = collection_name
+        self.location = location
+        self.embedder = embedder or Embedder(model_handle, batch_size=batch_size)
+        self.batch_size = batch_size
 
     @cached_property
     def qdrant_client(self):
-        return QdrantClient("http://localhost:6333")
+        return QdrantClient(self.location)
     
     def crete_collection(self):
         self.qdrant_client.delete_collection(self.collection_name)
@@ -97,20 +287,22 @@ class VectorSearchEngine:
             }
         )
 
+        texts = [doc["question"] + " " + doc["text"] for doc in self.documents]
+        vectors = self.embedder.embed_documents(texts)
+
         points = []
-        for id, doc in enumerate(tqdm(self.documents)):
-            text = doc["question"] + " " + doc["text"]
-            vector = models.Document(text=text, model=self.model_handle)
+        for id, (doc, vector) in enumerate(zip(tqdm(self.documents), vectors)):
             point = models.PointStruct(
                 id=id,
-                vector=vector,
+                vector=vector.tolist(),
                 payload=doc
             )
             points.append(point)
 
-        self.qdrant_client.upsert(
+        self.qdrant_client.upload_points(
             collection_name=self.collection_name,
-            points=points
+            points=points,
+            batch_size=self.batch_size
         )
 
     def create_payload_index(self, field_name: str):
@@ -121,14 +313,12 @@ class VectorSearchEngine:
             field_schema="keyword"
         )
 
+    @traced("search.qdrant")
     def search(self, query: str, filter_field: str, filter_value: str, num_result: int = 1):
 
         results = self.qdrant_client.query_points(
             collection_name=self.collection_name,
-            query=models.Document( #embed the query text locally with "jinaai/jina-embeddings-v2-small-en"
-                text=query,
-                model=self.model_handle 
-            ),
+            query=self.embedder.embed_query(query).tolist(), # embedded locally, cached for repeated queries
             query_filter=models.Filter( # filter by course name
             must=[
                 models.FieldCondition(
@@ -141,4 +331,245 @@ class VectorSearchEngine:
             with_payload=True #to get metadata in the results
         )
 
-        return [el.payload for el in results.points]
\ No newline at end of file
+        return [el.payload for el in results.points]
+
+class NumpyVectorSearchEngine:
+    """
+    In-process vector search without Qdrant: normalized embeddings in one contiguous matrix
+    (float32, float16 or int8 with per-row scales), cosine top-k with argpartition and
+    keyword filters as precomputed boolean masks. Can be saved and memory-mapped from disk.
+    """
+
+    DTYPES = ("float32", "float16", "int8")
+    SNAPSHOT_STATE_FILE = "engine.pkl"
+    CHUNK_ROWS = 8192  # rows upcast at once when scoring float16/int8
+
+    def __init__(
+        self,
+        documents: list[dict[str, str]],
+        embedder: Embedder,
+        dtype: str = "float32",
+        filter_fields: tuple[str, ...] = ("course",),
+    ) -> None:
+        if dtype not in self.DTYPES:
+            raise ValueError(f"dtype must be one of {self.DTYPES}, got {dtype!r}")
+        self.documents = documents
+        self.embedder = embedder
+        self.dtype = dtype
+        self.filter_fields = filter_fields
+
+        texts = [doc["question"] + " " + doc["text"] for doc in documents]
+        self.matrix, self.scales = self._quantize(self._normalize(self.embedder.embed_documents(texts)))
+        self.masks = {
+            field: {
+                value: np.array([doc.get(field) == value for doc in documents])
+                for value in {doc.get(field) for doc in documents}
+            }
+            for field in filter_fields
+        }
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+    def _quantize(self, vectors: np.ndarray) -> tuple[np.ndarray, np.ndarray | None]:
+        if self.dtype == "int8":
+            scales = np.abs(vectors).max(axis=1) / 127
+            scales[scales == 0] = 1
+            matrix = np.round(vectors / scales[:, None]).astype(np.int8)
+            return np.ascontiguousarray(matrix), scales.astype(np.float32)
+        return np.ascontiguousarray(vectors, dtype=self.dtype), None
+
+    def _scores(self, queries: np.ndarray) -> np.ndarray:
+        if self.dtype == "float32":
+            return queries @ self.matrix.T
+        # numpy has no BLAS kernels for float16/int8: upcast one block of rows at a time,
+        # so the full matrix is never copied (and a memory-mapped one stays shared)
+        scores = np.empty((len(queries), len(self.matrix)), dtype=np.float32)
+        for start in range(0, len(self.matrix), self.CHUNK_ROWS):
+            block = self.matrix[start:start + self.CHUNK_ROWS].astype(np.float32)
+            np.matmul(queries, block.T, out=scores[:, start:start + self.CHUNK_ROWS])
+        if self.scales is not None:
+            scores *= self.scales
+        return scores
+
+    @traced("search.numpy")
+    def search_many(
+        self,
+        queries: list[str],
+        filter_field: str | None = None,
+        filter_value: str | None = None,
+        num_result: int = 5,
+    ) -> list[list[dict[str, str]]]:
+        """Score all queries with a single matrix product, return top `num_result` documents per query."""
+        query_vectors = self._normalize([self.embedder.embed_query(query) for query in queries])
+        scores = self._scores(query_vectors)
+
+        if filter_field is not None:
+            mask = self.masks[filter_field].get(filter_value)
+            if mask is None:
+                return [[] for _ in queries]
+            scores[:, ~mask] = -np.inf
+
+        k = min(num_result, len(self.documents))
+        if k == 0:
+            return [[] for _ in queries]
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        top = np.take_along_axis(top, np.argsort(-top_scores, axis=1), axis=1)
+
+        return [
+            [self.documents[i] for i in row if np.isfinite(scores[query_id, i])]
+            for query_id, row in enumerate(top)
+        ]
+
+    def search(
+        self,
+        query: str,
+        filter_field: str | None = None,
+        filter_value: str | None = None,
+        num_result: int = 5,
+    ) -> list[dict[str, str]]:
+        return self.search_many([query], filter_field, filter_value, num_result)[0]
+
+    def save(self, path: str) -> None:
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "matrix.npy"), self.matrix)
+        state = {key: value for key, value in vars(self).items() if key not in ("matrix", "embedder")}
+        with open(os.path.join(path, self.SNAPSHOT_STATE_FILE), "wb") as file:
+            pickle.dump(state, file, protocol=5)
+
+    @classmethod
+    def load(cls, path: str, embedder: Embedder, mmap: bool = True) -> "NumpyVectorSearchEngine":
+        """Load an engine saved with `save` without re-embedding, memory-mapping the embeddings matrix."""
+        with open(os.path.join(path, cls.SNAPSHOT_STATE_FILE), "rb") as file:
+            state = pickle.load(file)
+
+        engine = cls.__new__(cls)
+        engine.__dict__.update(state)
+        engine.embedder = embedder
+        engine.matrix = np.load(os.path.join(path, "matrix.npy"), mmap_mode="r" if mmap else None)
+        return engine
+
+
+class HybridSearchEngine:
+    """
+    Sparse (minsearch TF-IDF) and dense retrieval run concurrently and fused with reciprocal rank fusion
+    ("rrf") or weighted fusion of rank-normalized scores ("weighted").
+    `search_with_timings` also returns the per-stage latency (seconds). The engine owns a thread
+    pool: use it as a context manager or call `close()`.
+    """
+
+    FUSIONS = ("rrf", "weighted")
+
+    def __init__(
+        self,
+        sparse_engine: MiniSearchEngine,
+        dense_engine: VectorSearchEngine | NumpyVectorSearchEngine,
+        fusion: str = "rrf",
+        weights: tuple[float, float] = (1.0, 1.0),
+        rrf_k: int = 60,
+        prefetch_factor: int = 5,
+        boost_dict: dict[str, int | float] | None = None,
+    ) -> None:
+        if fusion not in self.FUSIONS:
+            raise ValueError(f"fusion must be one of {self.FUSIONS}, got {fusion!r}")
+        self.sparse_engine = sparse_engine
+        self.dense_engine = dense_engine
+        self.fusion = fusion
+        self.weights = weights
+        self.rrf_k = rrf_k
+        self.prefetch_factor = prefetch_factor
+        self.boost_dict = boost_dict if boost_dict is not None else {"question": 3, "section": 0.5}
+        self.executor = ThreadPoolExecutor(max_workers=2)
+
+    def __enter__(self) -> "HybridSearchEngine":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.executor.shutdown()
+
+    @staticmethod
+    def _timed(function, **kwargs) -> tuple[list[dict[str, str]], float]:
+        start = time.perf_counter()
+        results = function(**kwargs)
+        return results, time.perf_counter() - start
+
+    @staticmethod
+    def _doc_key(doc: dict[str, str]) -> tuple[str | None, ...]:
+        # dense engines may return copies (e.g. Qdrant payloads), so documents are matched by content
+        return doc.get("course"), doc.get("question"), doc.get("text")
+
+    def _rank_score(self, rank: int, num_results: int) -> float:
+        if self.fusion == "rrf":
+            return 1 / (self.rrf_k + rank + 1)
+        return 1 - rank / num_results
+
+    def _fuse(self, result_lists: list[list[dict[str, str]]]) -> list[dict[str, str]]:
+        scores: dict[tuple, float] = {}
+        docs: dict[tuple, dict[str, str]] = {}
+        for weight, results in zip(self.weights, result_lists):
+            for rank, doc in enumerate(results):
+                key = self._doc_key(doc)
+                scores[key] = scores.get(key, 0) + weight * self._rank_score(rank, len(results))
+                docs.setdefault(key, doc)
+        return [docs[key] for key in sorted(scores, key=scores.get, reverse=True)]
+
+    def search(
+        self,
+        query: str,
+        filter_field: str,
+        filter_value: str,
+        num_result: int = 5,
+    ) -> list[dict[str, str]]:
+        return self.search_with_timings(query, filter_field, filter_value, num_result)[0]
+
+    @traced("search.hybrid")
+    def search_with_timings(
+        self,
+        query: str,
+        filter_field: str,
+        filter_value: str,
+        num_result: int = 5,
+    ) -> tuple[list[dict[str, str]], dict[str, float]]:
+        start = time.perf_counter()
+        limit = num_result * self.prefetch_factor
+
+        # the searches run in the context of the caller, so their spans belong to its trace
+        sparse = self.executor.submit(
+            contextvars.copy_context().run,
+            self._timed,
+            self.sparse_engine.search,
+            query=query,
+            boost_dict=self.boost_dict,
+            filter_dict={filter_field: filter_value},
+            num_result=limit,
+        )
+        dense = self.executor.submit(
+            contextvars.copy_context().run,
+            self._timed,
+            self.dense_engine.search,
+            query=query,
+            filter_field=filter_field,
+            filter_value=filter_value,
+            num_result=limit,
+        )
+        sparse_results, sparse_time = sparse.result()
+        dense_results, dense_time = dense.result()
+
+        fusion_start = time.perf_counter()
+        results = self._fuse([sparse_results, dense_results])[:num_result]
+        end = time.perf_counter()
+
+        timings = {
+            "sparse": sparse_time,
+            "dense": dense_time,
+            "fusion": end - fusion_start,
+            "total": end - start,
+        }
+        return results, timings
@@ -0,0 +1,199 @@
+import functools
+import itertools
+import json
+import math
+import os
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from typing import Any
+
+PERCENTILES = (50, 95, 99)
+
+
+@dataclass
+class Span:
+    name: str
+    start: float  # seconds since the start of the trace
+    duration: float = 0.0
+    span_id: int = 0
+    parent_id: int | None = None
+    attributes: dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class Trace:
+    trace_id: int
+    name: str
+    started_at: float  # unix time
+    duration: float = 0.0
+    attributes: dict[str, Any] = field(default_factory=dict)
+    spans: list[Span] = field(default_factory=list)
+    _start: float = field(default_factory=time.perf_counter, repr=False)
+
+
+_current_trace: ContextVar[Trace | None] = ContextVar("current_trace", default=None)
+_current_span: ContextVar[Span | None] = ContextVar("current_span", default=None)
+
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    """Nearest-rank percentile of sorted values."""
+    return sorted_values[max(0, math.ceil(p / 100 * len(sorted_values)) - 1)]
+
+
+def summarize(durations: dict[str, list[float]]) -> dict[str, dict[str, float]]:
+    summary = {}
+    for name, values in sorted(durations.items()):
+        values = sorted(values)
+        summary[name] = {"count": len(values), **{f"p{p}": percentile(values, p) for p in PERCENTILES}}
+    return summary
+
+
+class Tracer:
+    """
+    Timings of requests: `trace()` starts a per-request trace (kept in a context variable, so concurrent
+    requests in threads and asyncio tasks don't mix), `span()` times a step inside it with a monotonic clock.
+    Finished traces are appended to `export_file` as JSONL; durations of all traces and spans
+    (including spans outside a trace) are aggregated for `summary()`.
+    """
+
+    def __init__(self, export_file: str | None = None, max_samples: int = 10_000) -> None:
+        self.export_file = export_file
+        self.durations: dict[str, deque[float]] = defaultdict(lambda: deque(maxlen=max_samples))
+        self.lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def _record(self, name: str, duration: float) -> None:
+        with self.lock:
+            self.durations[name].append(duration)
+
+    @contextmanager
+    def trace(self, name: str, /, **attributes: Any) -> Iterator[Trace | Span]:
+        """Trace of a request, or a span when called within a trace."""
+        if _current_trace.get() is not None:
+            with self.span(name, **attributes) as span:
+                yield span
+            return
+
+        trace = Trace(next(self._ids), name, time.time(), attributes=attributes)
+        token = _current_trace.set(trace)
+        try:
+            yield trace
+        finally:
+            trace.duration = time.perf_counter() - trace._start
+            _current_trace.reset(token)
+            self._record(name, trace.duration)
+            self._export(trace)
+
+    @contextmanager
+    def span(self, name: str, /, **attributes: Any) -> Iterator[Span]:
+        trace = _current_trace.get()
+        parent = _current_span.get()
+        start = time.perf_counter()
+        span = Span(
+            name,
+            start=start - trace._start if trace is not None else 0.0,
+            span_id=next(self._ids),
+            parent_id=parent.span_id if parent is not None else None,
+            attributes=attributes,
+        )
+        token = _current_span.set(span)
+        try:
+            yield span
+        finally:
+            span.duration = time.perf_counter() - start
+            _current_span.reset(token)
+            self._record(name, span.duration)
+            if trace is not None:
+                trace.spans.append(span)
+
+    def add_span(self, name: str, start: float, /, **attributes: Any) -> Span:
+        """Record a step timed by the caller from `start` (time.perf_counter()) until now, e.g. a consumed stream."""
+        trace = _current_trace.get()
+        parent = _current_span.get()
+        end = time.perf_counter()
+        span = Span(
+            name,
+            start=start - trace._start if trace is not None else 0.0,
+            duration=end - start,
+            span_id=next(self._ids),
+            parent_id=parent.span_id if parent is not None else None,
+            attributes=attributes,
+        )
+        self._record(name, span.duration)
+        if trace is not None:
+            trace.spans.append(span)
+        return span
+
+    def traced(self, name: str) -> Callable:
+        """Decorator timing every call of the function as a span."""
+        def decorator(function: Callable) -> Callable:
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def _export(self, trace: Trace) -> None:
+        if self.export_file is None:
+            return
+        record = asdict(trace)
+        del record["_start"]
+        line = json.dumps(record, default=str) + "\n"
+        with self.lock:
+            with open(self.export_file, "a") as f_out:
+                f_out.write(line)
+
+    def summary(self) -> dict[str, dict[str, float]]:
+        with self.lock:
+            durations = {name: list(values) for name, values in self.durations.items()}
+        return summarize(durations)
+
+    def print_summary(self) -> None:
+        print_summary(self.summary())
+
+
+def record_llm_response(span: Span, response: Any) -> None:
+    """Token counts and durations (ns -> s) from the metadata of an Ollama response."""
+    for key in ("prompt_eval_count", "eval_count"):
+        if getattr(response, key, None) is not None:
+            span.attributes[key] = getattr(response, key)
+    for key in ("prompt_eval_duration", "eval_duration", "load_duration"):
+        if getattr(response, key, None) is not None:
+            span.attributes[key] = getattr(response, key) / 1e9
+
+
+def load_summary(path: str) -> dict[str, dict[str, float]]:
+    """Percentiles of the traces and spans in a JSONL export."""
+    durations = defaultdict(list)
+    with open(path) as f_in:
+        for line in f_in:
+            trace = json.loads(line)
+            durations[trace["name"]].append(trace["duration"])
+            for span in trace["spans"]:
+                durations[span["name"]].append(span["duration"])
+    return summarize(durations)
+
+
+def print_summary(summary: dict[str, dict[str, float]]) -> None:
+    print(f"{'name':<32}{'count':>8}" + "".join(f"{f'p{p} ms':>12}" for p in PERCENTILES))
+    for name, stats in summary.items():
+        print(f"{name:<32}{stats['count']:>8}" + "".join(f"{stats[f'p{p}'] * 1000:>12.1f}" for p in PERCENTILES))
+
+
+# shared by all modules, set TRACE_FILE to export the traces
+tracer = Tracer(export_file=os.environ.get("TRACE_FILE"))
+trace = tracer.trace
+span = tracer.span
+add_span = tracer.add_span
+traced = tracer.traced
+
+
+if __name__ == "__main__":  # python tracing.py traces.jsonl
+    print_summary(load_summary(sys.argv[1]))
@@ -0,0 +1,80 @@
+import heapq
+from dataclasses import dataclass
+
+from chat_history import estimate_tokens
+
+
+def render_document(doc: dict[str, str]) -> str:
+    return f"section: {doc['section']}\nquestion: {doc['question']}\nanswer: {doc['text']}"
+
+
+@dataclass
+class ContextEntry:
+    doc_id: int
+    score: float
+    text: str
+    tokens: int
+
+
+class AgentContext:
+    """
+    CONTEXT of the agent loop built incrementally from search results.
+
+    Documents are deduplicated by `_id` (ids stay seen after eviction, so evicted documents don't come back),
+    rendered once, and the lowest-scoring ones are evicted when the context exceeds `max_tokens`.
+    Documents without scores are scored by their rank in the search results.
+    """
+
+    def __init__(self, max_tokens: int = 4000) -> None:
+        self.max_tokens = max_tokens
+        self.entries: dict[int, ContextEntry] = {}  # in order of arrival
+        self.seen_ids: dict[int, None] = {}  # ordered set
+        self.tokens = 0
+        self._heap: list[tuple[float, int]] = []  # (score, doc_id), may contain stale items
+        self._rendered: str | None = None
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, doc_id: int) -> bool:
+        return doc_id in self.entries
+
+    def add(self, docs: list[dict[str, str]], scores: list[float] | None = None) -> int:
+        """Add documents that weren't seen before, returns the number of added documents."""
+        added = 0
+        for rank, doc in enumerate(docs):
+            doc_id = doc["_id"]
+            score = scores[rank] if scores is not None else 1 / (rank + 1)
+
+            if doc_id in self.seen_ids:
+                entry = self.entries.get(doc_id)
+                if entry is not None and score > entry.score:  # found again with a better rank
+                    entry.score = score
+                    heapq.heappush(self._heap, (score, doc_id))
+                continue
+
+            self.seen_ids[doc_id] = None
+            text = render_document(doc)
+            self.entries[doc_id] = ContextEntry(doc_id, score, text, estimate_tokens(text))
+            heapq.heappush(self._heap, (score, doc_id))
+            self.tokens += self.entries[doc_id].tokens
+            added += 1
+
+        if added:
+            self._rendered = None
+            self._evict()
+        return added
+
+    def _evict(self) -> None:
+        while self.tokens > self.max_tokens and self._heap:
+            score, doc_id = heapq.heappop(self._heap)
+            entry = self.entries.get(doc_id)
+            if entry is None or entry.score != score:  # stale heap item
+                continue
+            del self.entries[doc_id]
+            self.tokens -= entry.tokens
+
+    def render(self) -> str:
+        if self._rendered is None:
+            self._rendered = "\n\n".join(entry.text for entry in self.entries.values())
+        return self._rendered
@@ -1,9 +1,10 @@
 from minsearch_engine import MiniSearchEngine
 from minsearch.append import AppendableIndex
-import json
 import requests
 from llm import Llm
+from chat_history import ChatHistory, compact_json
 from typing import Any
+from tracing import span, tracer
 
 
 MODEL = 'llama3.1:8b'
@@ -67,12 +68,13 @@ def do_call(tool_call_response: dict[str, Any]):
     arguments = tool_call_response["arguments"]
 
     f = globals()[function_name]
-    result = f(**arguments)
+    with span("tool", name=function_name):
+        result = f(**arguments)
 
     return {
         "role": "tool",
         # "call_id": tool_call_response.call_id,
-        "content": json.dumps(result, indent=2),
+        "content": compact_json(result),
     }
 
 developer_prompt = """
@@ -86,26 +88,24 @@ and then based on the results, make more requests.
 At the end of each response, ask the user a follow up question based on your answer.
 """.strip()
 
-chat_messages = [
-    {"role": "developer", "content": developer_prompt},
-]
+history = ChatHistory(developer_prompt) # sliding window with compacted tool outputs
 tools = [search_tool]
 
 while True: # main Q&A loop
     question = input() # How do I do my best for module 1?
     if question == 'stop':
+        tracer.print_summary()
         break
 
-    message = {"role": "user", "content": question}
-    chat_messages.append(message)
+    history.add_user_message(question)
 
     while True: # request-response loop - query API till get a message
         response = client.get_response_with_tools(
-            input=chat_messages,
+            input=history.messages(),
             tools=tools
         )
         dumped_response= response.model_dump()
-        chat_messages.append(dumped_response["message"])
+        history.add_message(dumped_response["message"])
         print('Response:', dumped_response["message"])
         message = dumped_response["message"]
 
@@ -114,7 +114,7 @@ while True: # main Q&A loop
                 print('function_call:', entry["function"]["name"])
                 print()
                 result = do_call(entry["function"])
-                chat_messages.append(result)
+                result = history.add_tool_result(entry["function"]["name"], result["content"])
                 print('function_call_output:', result["content"])
         else:
             print(message["content"])
@@ -0,0 +1,89 @@
+"""
+Compares prompt evaluation of the agent prompt with the iteration number inside the instructions
+(one user message, as it was formatted before) and with the static instructions as a system message
+followed by the dynamic user message. The layouts run alternately for ROUNDS rounds (the order is
+swapped every round), so model warm-up and cache state don't favour the one that runs second.
+Requires a running Ollama with the MODEL pulled.
+"""
+import json
+import statistics
+
+from ollama import chat
+
+from agent_prompts import SYSTEM_PROMPT, USER_PROMPT
+from compiled_template import CompiledTemplate
+from llm import KEEP_ALIVE
+
+MODEL = 'llama3.1:8b'
+MAX_ITERATIONS = 3
+ROUNDS = 4
+QUESTIONS = [
+    'what do I need to do to be successful at module 1?',
+    'can I still join the course after the start date?',
+    'how do I run kafka with docker?',
+    'where can I find the homework deadlines?',
+]
+
+system_prompt = CompiledTemplate(SYSTEM_PROMPT, max_iterations=MAX_ITERATIONS - 1).render()
+user_prompt = CompiledTemplate(USER_PROMPT)
+# the previous layout: the iteration number in the middle of the instructions, a single user message
+interleaved_prompt = CompiledTemplate(
+    SYSTEM_PROMPT.replace(
+        "The current iteration number is given in ITERATION_NUMBER.",
+        "The current iteration number: {iteration_number}."
+    ) + "\n\n" + USER_PROMPT.split("</ITERATION_NUMBER>", 1)[1].strip(),
+    max_iterations=MAX_ITERATIONS - 1
+)
+
+
+def run(build_messages) -> tuple[list[int], list[float]]:
+    counts, durations = [], []
+    for question in QUESTIONS:
+        previous_actions = []
+        for iteration in range(MAX_ITERATIONS):
+            values = dict(
+                question=question,
+                context="",
+                search_queries="",
+                previous_actions='\n'.join([json.dumps(a) for a in previous_actions]),
+                iteration_number=iteration,
+            )
+            response = chat(
+                model=MODEL,
+                messages=build_messages(values),
+                keep_alive=KEEP_ALIVE,
+                options={"num_predict": 1},  # only the prompt evaluation is measured
+            )
+            counts.append(response.prompt_eval_count or 0)
+            durations.append((response.prompt_eval_duration or 0) / 1e6)
+            previous_actions.append({"action": "SEARCH", "keywords": [question]})
+    return counts, durations
+
+
+def interleaved(values):
+    return [{'role': 'user', 'content': interleaved_prompt.render(**values)}]
+
+
+def static_prefix(values):
+    return [
+        {'role': 'system', 'content': system_prompt},
+        {'role': 'user', 'content': user_prompt.render(**values)},
+    ]
+
+
+chat(model=MODEL, messages=[{'role': 'user', 'content': 'hi'}], keep_alive=KEEP_ALIVE, options={"num_predict": 1})  # load the model
+
+layouts = [("interleaved", interleaved), ("static prefix", static_prefix)]
+results = {name: ([], []) for name, _ in layouts}
+for round_number in range(ROUNDS):
+    for name, build_messages in layouts if round_number % 2 == 0 else layouts[::-1]:
+        counts, durations = run(build_messages)
+        results[name][0].extend(counts)
+        results[name][1].extend(durations)
+
+for name, (counts, durations) in results.items():
+    print(
+        f"{name:>14}: prompt_eval_count mean {statistics.mean(counts):.0f}, "
+        f"prompt_eval_duration mean {statistics.mean(durations):.1f} ms, "
+        f"median {statistics.median(durations):.1f} ms"
+    )
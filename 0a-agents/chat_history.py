@@ -0,0 +1,108 @@
+import json
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from typing import Any
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1  # ~4 characters per token for English text
+
+
+def compact_json(result: Any) -> str:
+    return json.dumps(result, separators=(",", ":"), ensure_ascii=False)
+
+
+@dataclass
+class _Turn:
+    messages: list[dict[str, Any]]  # starting with the user message
+    tool_refs: list[tuple[int, str]] = field(default_factory=list)  # (index in messages, reference)
+    tool_outputs_dropped: bool = False
+
+
+class ChatHistory:
+    """
+    Chat messages of a conversation, compacted before they're sent to the LLM:
+
+    - tool outputs are stored as compact JSON, outputs longer than `max_tool_chars` are truncated and
+      the full output is kept in `tool_outputs` under a reference (e.g. "search-3");
+    - tool outputs of turns older than `keep_tool_turns` are replaced with their reference;
+    - only the last `max_turns` turns (user message and the responses to it) are sent, and older turns
+      are dropped until the request fits `max_tokens`. The developer prompt is always sent.
+    """
+
+    def __init__(
+        self,
+        developer_prompt: str,
+        max_turns: int = 10,
+        keep_tool_turns: int = 2,
+        max_tool_chars: int = 2000,
+        max_tokens: int = 6000,
+        token_counter: Callable[[str], int] = estimate_tokens,
+    ) -> None:
+        self.developer_message = {"role": "developer", "content": developer_prompt}
+        self.max_turns = max_turns
+        self.keep_tool_turns = keep_tool_turns
+        self.max_tool_chars = max_tool_chars
+        self.max_tokens = max_tokens
+        self.token_counter = token_counter
+        self.turns: list[_Turn] = []
+        self.tool_outputs: dict[str, str] = {}
+        self._tool_calls = 0
+
+    def add_user_message(self, content: str) -> None:
+        self.turns.append(_Turn([{"role": "user", "content": content}]))
+        if len(self.turns) > self.max_turns:  # never sent again
+            for turn in self.turns[:-self.max_turns]:
+                for _, ref in turn.tool_refs:
+                    self.tool_outputs.pop(ref, None)
+            del self.turns[:-self.max_turns]
+        for turn in self.turns[:-self.keep_tool_turns or None]:
+            self._drop_tool_outputs(turn)
+
+    def add_message(self, message: dict[str, Any]) -> None:
+        self.turns[-1].messages.append(message)
+
+    def add_tool_result(self, name: str, result: Any) -> dict[str, Any]:
+        """Add the result of a tool call, returns the (possibly truncated) tool message."""
+        output = result if isinstance(result, str) else compact_json(result)
+        self._tool_calls += 1
+        ref = f"{name}-{self._tool_calls}"
+        self.tool_outputs[ref] = output
+
+        if len(output) > self.max_tool_chars:
+            output = f"{output[:self.max_tool_chars]}... [truncated {len(output)} characters, ref {ref}]"
+        message = {"role": "tool", "content": output}
+
+        turn = self.turns[-1]
+        turn.tool_refs.append((len(turn.messages), ref))
+        turn.messages.append(message)
+        return message
+
+    def _drop_tool_outputs(self, turn: _Turn) -> None:
+        if turn.tool_outputs_dropped:
+            return
+        for i, ref in turn.tool_refs:
+            turn.messages[i] = {"role": "tool", "content": f"[output omitted, ref {ref}]"}
+        turn.tool_outputs_dropped = True
+
+    def _message_tokens(self, message: dict[str, Any]) -> int:
+        tokens = self.token_counter(message.get("content") or "")
+        if message.get("tool_calls"):
+            tokens += self.token_counter(compact_json(message["tool_calls"]))
+        return tokens
+
+    def messages(self) -> list[dict[str, Any]]:
+        """Messages of the next request: the developer prompt and the most recent turns within max_tokens."""
+        budget = self.max_tokens - self._message_tokens(self.developer_message)
+        selected: list[_Turn] = []
+        for turn in reversed(self.turns):
+            tokens = sum(self._message_tokens(message) for message in turn.messages)
+            if selected and tokens > budget:  # the current turn is always sent
+                break
+            budget -= tokens
+            selected.append(turn)
+
+        messages = [self.developer_message]
+        for turn in reversed(selected):
+            messages.extend(turn.messages)
+        return messages
@@ -0,0 +1,70 @@
+import re
+from string import Formatter
+from typing import Any
+
+
+FIELD_NAME_PATTERN = re.compile(r"[^.\[]*")  # the keyword of a field name, e.g. "doc" in "doc[text]"
+
+
+class CompiledTemplate:
+    """
+    `str.format` template parsed once into literal and slot segments.
+
+    Fields passed at compile time (`static`) are baked into the literals. The leading literal (`prefix`)
+    is the same for every render, so keeping it at the start of the prompt (e.g. as the system message)
+    lets Ollama reuse the KV cache of the prefix between iterations and users.
+    Fields can use attribute and index lookups (`{doc[text]}`, `{action.name}`) like `str.format`;
+    positional fields and nested fields in format specs are rejected when compiling.
+    """
+
+    def __init__(self, template: str, **static: Any) -> None:
+        formatter = Formatter()
+        segments: list[str | tuple[str, str | None, str]] = []
+        fields = set()
+
+        for literal, field_name, format_spec, conversion in formatter.parse(template):
+            if literal:
+                segments.append(literal)
+            if field_name is None:
+                continue
+            name = FIELD_NAME_PATTERN.match(field_name).group()
+            if not name or name.isdigit():
+                raise ValueError(f"positional field {{{field_name}}} in the template, use keyword fields")
+            if "{" in format_spec:
+                raise ValueError(f"nested field in the format spec of {{{field_name}}} is not supported")
+            if name in static:
+                value, _ = formatter.get_field(field_name, (), static)
+                value = formatter.convert_field(value, conversion)
+                segments.append(format(value, format_spec))
+            else:
+                segments.append((field_name, conversion, format_spec))
+                fields.add(name)
+
+        # merge neighbouring literals
+        merged: list[str | tuple[str, str | None, str]] = []
+        for segment in segments:
+            if merged and isinstance(segment, str) and isinstance(merged[-1], str):
+                merged[-1] += segment
+            else:
+                merged.append(segment)
+
+        self.prefix = merged.pop(0) if merged and isinstance(merged[0], str) else ""
+        self.segments = merged
+        self.fields = fields
+        self._formatter = formatter
+
+    def render_dynamic(self, **values: Any) -> str:
+        """Render everything after the static prefix."""
+        parts = []
+        for segment in self.segments:
+            if isinstance(segment, str):
+                parts.append(segment)
+            else:
+                field_name, conversion, format_spec = segment
+                value, _ = self._formatter.get_field(field_name, (), values)
+                value = self._formatter.convert_field(value, conversion)
+                parts.append(format(value, format_spec))
+        return "".join(parts)
+
+    def render(self, **values: Any) -> str:
+        return self.prefix + self.render_dynamic(**values)
@@ -0,0 +1,165 @@
+import asyncio
+import contextvars
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Protocol
+
+from ollama import AsyncClient
+from ollama import ChatResponse
+
+from chat_assistant import ChatInterface, Tools
+# shared modules of 0a-agents, the scripts using this module put 0a-agents on sys.path
+from chat_history import ChatHistory
+from tracing import record_llm_response, span, trace
+
+
+class AsyncChatClient(Protocol):
+    async def chat(self, model: str, messages: list, tools: list | None) -> ChatResponse:
+        ...
+
+
+@dataclass
+class Session:
+    session_id: str
+    history: ChatHistory
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)  # one turn at a time per session
+    last_active: float = field(default_factory=time.monotonic)
+
+
+@dataclass
+class Turn:
+    answer: str
+    tool_calls: list[tuple[dict[str, Any], dict[str, Any]]]  # (call, result)
+    latency: float
+
+
+class SessionStore:
+    """In-memory conversations by session id, the least recently active are dropped above `max_sessions`."""
+
+    def __init__(self, developer_prompt: str, max_sessions: int = 10_000) -> None:
+        self.developer_prompt = developer_prompt
+        self.max_sessions = max_sessions
+        self.sessions: OrderedDict[str, Session] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.sessions)
+
+    def get(self, session_id: str) -> Session:
+        session = self.sessions.get(session_id)
+        if session is None:
+            session = Session(session_id, ChatHistory(self.developer_prompt))
+            self.sessions[session_id] = session
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+        else:
+            self.sessions.move_to_end(session_id)
+        session.last_active = time.monotonic()
+        return session
+
+    def close(self, session_id: str) -> None:
+        self.sessions.pop(session_id, None)
+
+
+class AsyncChatEngine:
+    """
+    Conversation engine of ChatAssistant without the interface: `ask(session_id, question)` runs one turn
+    (LLM requests and tool rounds) of the given session. Sessions share one LLM client with at most
+    `max_concurrency` requests in flight; tools run on the thread pool of `Tools` and are awaited
+    without holding a thread of the event loop, so size `Tools(max_workers)` for the concurrent tool calls.
+    After `max_tool_rounds` tool rounds the model is asked without tools, so the turn ends with an answer.
+    """
+
+    def __init__(
+        self,
+        tools: Tools,
+        developer_prompt: str,
+        client: AsyncChatClient | None = None,
+        model: str = 'llama3.1:8b',
+        max_concurrency: int = 16,
+        max_tool_rounds: int = 5,
+        store: SessionStore | None = None,
+    ) -> None:
+        self.tools = tools
+        self.client = client or AsyncClient()
+        self.model = model
+        self.max_tool_rounds = max_tool_rounds
+        self.store = store or SessionStore(developer_prompt)
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def llama(self, chat_messages: list[dict[str, Any]], with_tools: bool = True) -> ChatResponse:
+        tools = self.tools.get_tools() if with_tools else None
+        async with self.semaphore:
+            with span("llm.tools", model=self.model) as chat_span:
+                response = await self.client.chat(model=self.model, messages=chat_messages, tools=tools)
+                record_llm_response(chat_span, response)
+        return response
+
+    async def function_call(self, call: dict[str, Any]) -> dict[str, Any]:
+        """`Tools.function_call` on the pool of `Tools`, an error message on timeout or exception."""
+        timeout = self.tools.timeouts.get(call["name"])
+        # the call runs in a copy of the context, so its span belongs to the turn's trace
+        future = self.tools.executor.submit(contextvars.copy_context().run, self.tools.function_call, call)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except TimeoutError:  # the call can't be interrupted and finishes in the background
+            return self.tools.error_output(f"{call['name']} timed out after {timeout}s")
+        except Exception as e:
+            return self.tools.error_output(f"{call['name']} failed: {type(e).__name__}: {e}")
+
+    async def function_calls(self, calls: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """Run the calls concurrently, results are in the order of the calls."""
+        return list(await asyncio.gather(*(self.function_call(call) for call in calls)))
+
+    @staticmethod
+    def _reject_tool_calls(history: ChatHistory, message: dict[str, Any]) -> None:
+        """Every tool call needs a tool message in the history, even when it isn't run."""
+        for entry in message["tool_calls"]:
+            history.add_tool_result(
+                entry["function"]["name"],
+                {"error": "tool call limit reached, answer with the information you have"},
+            )
+
+    async def ask(self, session_id: str, question: str) -> Turn:
+        start = time.perf_counter()
+        session = self.store.get(session_id)
+        tool_calls = []
+
+        with trace("chat.turn", session_id=session_id):
+            async with session.lock:
+                history = session.history
+                history.add_user_message(question)
+
+                for tool_round in range(self.max_tool_rounds + 1):
+                    with_tools = tool_round < self.max_tool_rounds
+                    response = await self.llama(history.messages(), with_tools)
+                    message = response.model_dump()["message"]
+                    history.add_message(message)
+
+                    if not message["tool_calls"]:
+                        break
+                    if not with_tools:  # not offered any tools, but the model may still ask
+                        self._reject_tool_calls(history, message)
+                        break
+                    calls = [entry["function"] for entry in message["tool_calls"]]
+                    results = await self.function_calls(calls)
+                    for call, result in zip(calls, results):
+                        history.add_tool_result(call["name"], result["content"])
+                    tool_calls.extend(zip(calls, results))
+
+        return Turn(answer=message["content"], tool_calls=tool_calls, latency=time.perf_counter() - start)
+
+
+async def run_interactive(engine: AsyncChatEngine, chat_interface: ChatInterface, session_id: str = "local") -> None:
+    """The ChatAssistant.run loop on top of the engine."""
+    while True:
+        question = await asyncio.to_thread(chat_interface.input)
+        if question.strip().lower() == 'stop':
+            chat_interface.display("Chat ended.")
+            engine.store.close(session_id)
+            break
+
+        turn = await engine.ask(session_id, question)
+        for call, result in turn.tool_calls:
+            chat_interface.display_function_call(call, result)
+        chat_interface.display_response({"content": turn.answer})
@@ -0,0 +1,50 @@
+"""
+Calls/sec of MCPClient against weather_server.py: one call at a time vs many calls in flight.
+
+    python benchmark_mcp_client.py --calls 500 --concurrency 1 8 32
+"""
+import argparse
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from mcp_client import MCPClient
+
+
+def run(client: MCPClient, calls: int, concurrency: int) -> float:
+    cities = [f"city{i}" for i in range(calls)]
+    start = time.perf_counter()
+    if concurrency == 1:
+        for city in cities:
+            client.call_tool("get_weather", {"city": city})
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(lambda city: client.call_tool("get_weather", {"city": city}), cities))
+    return calls / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    args = parser.parse_args()
+
+    client = MCPClient([sys.executable, "weather_server.py"], verbose=False)
+    client.start_server()
+    try:
+        client.initialize()
+        client.initialized()
+        client.get_tools()
+        run(client, 20, 1)  # warm up
+
+        for concurrency in args.concurrency:
+            print(f"concurrency {concurrency:>3}: {run(client, args.calls, concurrency):.0f} calls/sec")
+
+        # pipelined without threads
+        start = time.perf_counter()
+        futures = [client.call_tool_async("get_weather", {"city": f"city{i}"}) for i in range(args.calls)]
+        for future in futures:
+            client.wait(future)
+        print(f"pipelined: {args.calls / (time.perf_counter() - start):.0f} calls/sec")
+    finally:
+        client.stop_server()
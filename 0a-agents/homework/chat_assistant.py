@@ -1,5 +1,7 @@
-
+import contextvars
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any
 
 import html2text
@@ -7,15 +9,42 @@ from ollama import chat
 from ollama import ChatResponse
 import markdown
 
+# shared modules of 0a-agents, the scripts using this module put 0a-agents on sys.path
+from chat_history import ChatHistory, compact_json
+from tool_cache import ToolCache
+from tracing import record_llm_response, span, trace
+
 
 class Tools:
-    def __init__(self):
+    def __init__(self, max_workers: int = 8):
         self.tools = {}
         self.functions = {}
-
-    def add_tool(self, function, description):
+        self.timeouts = {}
+        self.caches: dict[str, ToolCache] = {}
+        self.invalidates: dict[str, list[str]] = {}
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tool")
+
+    def add_tool(
+        self,
+        function,
+        description,
+        timeout: float | None = None,
+        cache: ToolCache | None = None,
+        invalidates: list[str] | None = None,
+    ):
+        """
+        `cache` memoizes the results of the tool, `invalidates` lists the tools
+        whose cached results are cleared when this tool runs (e.g. set_weather -> get_weather).
+        """
         self.tools[function.__name__] = description
         self.functions[function.__name__] = function
+        self.timeouts[function.__name__] = timeout
+        if cache is not None:
+            self.caches[function.__name__] = cache
+        self.invalidates[function.__name__] = invalidates or []
+
+    def cache_stats(self) -> dict[str, dict[str, int]]:
+        return {name: cache.stats() for name, cache in self.caches.items()}
     
     def get_tools(self):
         return list(self.tools.values())
@@ -24,12 +53,61 @@ class Tools:
         function_name = tool_call_response["name"]
         arguments = tool_call_response["arguments"]
 
-        f = self.functions[function_name]
-        result = f(**arguments)
+        f = self.functions.get(function_name)
+        if f is None:  # let the model pick one of the tools
+            return self.error_output(f"unknown tool {function_name}")
+        cache = self.caches.get(function_name)
+        with span("tool", name=function_name) as tool_span:
+            if cache is None:
+                result = f(**arguments)
+            else:
+                key = cache.key(arguments)
+                generation = cache.generation
+                result = cache.get(key)
+                tool_span.attributes["cached"] = result is not ToolCache.MISSING
+                if result is ToolCache.MISSING:
+                    result = f(**arguments)
+                    cache.put(key, result, generation)
+
+        for name in self.invalidates.get(function_name, []):
+            if name in self.caches:
+                self.caches[name].clear()
 
         return {
             "role": "tool",
-            "content": json.dumps(result, indent=2),
+            "content": compact_json(result),
+        }
+
+    def function_calls(self, tool_call_responses: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """
+        Run the calls concurrently, results are in the order of the calls.
+        A call exceeding the timeout of its tool or raising an exception returns an error message instead
+        (a timed out call can't be interrupted and finishes in the background).
+        """
+        start = time.monotonic()
+        # each call runs in a copy of the caller's context, so its span belongs to the caller's trace
+        futures = [
+            self.executor.submit(contextvars.copy_context().run, self.function_call, call)
+            for call in tool_call_responses
+        ]
+
+        results = []
+        for call, future in zip(tool_call_responses, futures):
+            timeout = self.timeouts.get(call["name"])
+            try:
+                remaining = None if timeout is None else max(0.0, start + timeout - time.monotonic())
+                results.append(future.result(timeout=remaining))
+            except TimeoutError:
+                results.append(self.error_output(f"{call['name']} timed out after {timeout}s"))
+            except Exception as e:  # a failing tool doesn't discard the results of the other calls
+                results.append(self.error_output(f"{call['name']} failed: {type(e).__name__}: {e}"))
+        return results
+
+    @staticmethod
+    def error_output(message: str) -> dict[str, Any]:
+        return {
+            "role": "tool",
+            "content": json.dumps({"error": message}),
         }
 
 
@@ -78,23 +156,25 @@ class ChatInterface:
 
 
 class ChatAssistant:
-    def __init__(self, tools: Tools, developer_prompt, chat_interface):
+    def __init__(self, tools: Tools, developer_prompt, chat_interface, max_history_tokens: int = 6000):
         self.tools = tools
         self.developer_prompt = developer_prompt
         self.chat_interface = chat_interface
+        self.max_history_tokens = max_history_tokens
     
     def llama(self, chat_messages) -> ChatResponse:
-        return chat(
-            model='llama3.1:8b',
-            messages=chat_messages,
-            tools=self.tools.get_tools(),
-        )
+        with span("llm.tools", model='llama3.1:8b') as chat_span:
+            response = chat(
+                model='llama3.1:8b',
+                messages=chat_messages,
+                tools=self.tools.get_tools(),
+            )
+            record_llm_response(chat_span, response)
+        return response
 
 
     def run(self):
-        chat_messages = [
-            {"role": "developer", "content": self.developer_prompt},
-        ]
+        history = ChatHistory(self.developer_prompt, max_tokens=self.max_history_tokens)
 
         # Chat loop
         while True:
@@ -103,23 +183,23 @@ class ChatAssistant:
                 self.chat_interface.display("Chat ended.")
                 break
 
-            message = {"role": "user", "content": question}
-            chat_messages.append(message)
-
-            while True:  # inner request loop
-                response = self.llama(chat_messages)
-                dumped_response = response.model_dump()
-                chat_messages.append(dumped_response["message"])
-                message = dumped_response["message"]
-                print('Response:', dumped_response)
-
-                if message["tool_calls"]:
-                    for entry in message["tool_calls"]:
-                        result = self.tools.function_call(entry["function"])
-                        chat_messages.append(result)
-                        self.chat_interface.display_function_call(entry["function"], result)
-                else:
-                    self.chat_interface.display_response(message)
-                    break
+            history.add_user_message(question)
+
+            with trace("chat.turn", question=question):
+                while True:  # inner request loop
+                    response = self.llama(history.messages())
+                    dumped_response = response.model_dump()
+                    history.add_message(dumped_response["message"])
+                    message = dumped_response["message"]
+                    print('Response:', dumped_response)
+
+                    if message["tool_calls"]:
+                        calls = [entry["function"] for entry in message["tool_calls"]]
+                        for call, result in zip(calls, self.tools.function_calls(calls)):
+                            history.add_tool_result(call["name"], result["content"])
+                            self.chat_interface.display_function_call(call, result)
+                    else:
+                        self.chat_interface.display_response(message)
+                        break
 
 
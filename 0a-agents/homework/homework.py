@@ -1,5 +1,10 @@
+import os
 import random
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # modules shared by 0a-agents
 from chat_assistant import Tools, ChatAssistant, ChatInterface
+from tool_cache import ToolCache
 
 known_weather_data = {
     'berlin': 20.0
@@ -61,8 +66,8 @@ set_weather_tool = {
 }
 
 tools = Tools()
-tools.add_tool(get_weather, get_weather_tool)
-tools.add_tool(set_weather, set_weather_tool)
+tools.add_tool(get_weather, get_weather_tool, cache=ToolCache(ttl=600))
+tools.add_tool(set_weather, set_weather_tool, invalidates=["get_weather"])
 chat_assistant = ChatAssistant(
     tools=tools,
     developer_prompt="You are a helpful assistant that can answer questions about the weather.",
@@ -0,0 +1,104 @@
+"""
+Load test of AsyncChatEngine with a fake LLM: SESSIONS concurrent sessions, TURNS questions each.
+Every question is answered after one get_weather tool round, so a turn is two LLM requests.
+
+    python load_test.py --sessions 500 --turns 3 --latency 0.05 --tool-latency 0.2 --tool-workers 256
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+
+from ollama import ChatResponse, Message
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # modules shared by 0a-agents
+from async_assistant import AsyncChatEngine
+from chat_assistant import Tools
+
+TOOL_LATENCY = 0.0  # seconds, set by --tool-latency
+
+get_weather_tool = {
+    "type": "function",
+    "function": {
+        "name": "get_weather",
+        "description": "Search the actual weather in a given city.",
+        "parameters": {
+            "type": "object",
+            "properties": {"city": {"type": "string", "description": "The name of the city."}},
+            "required": ["city"],
+        }
+    }
+}
+
+
+def get_weather(city: str) -> float:
+    time.sleep(TOOL_LATENCY)  # like a request to a weather service, holds a thread of the tool pool
+    return round(random.uniform(-5, 35), 1)
+
+
+class FakeLlm:
+    """Asks for the weather of the city in the last user message, then answers with the tool result."""
+
+    def __init__(self, latency: float = 0.05) -> None:
+        self.latency = latency
+        self.requests = 0
+
+    async def chat(self, model: str, messages: list, tools: list | None) -> ChatResponse:
+        self.requests += 1
+        await asyncio.sleep(self.latency * random.uniform(0.5, 1.5))
+
+        last = messages[-1]
+        if last["role"] == "tool":
+            return ChatResponse(message=Message(role="assistant", content=f"It's {last['content']} degrees."))
+        city = last["content"].rsplit(" ", 1)[-1]
+        return ChatResponse(message=Message(role="assistant", content="", tool_calls=[
+            Message.ToolCall(function=Message.ToolCall.Function(name="get_weather", arguments={"city": city}))
+        ]))
+
+
+async def run_session(engine: AsyncChatEngine, session_id: str, turns: int, latencies: list[float]) -> None:
+    for turn_number in range(turns):
+        turn = await engine.ask(session_id, f"What's the weather in city{turn_number}")
+        latencies.append(turn.latency)
+    engine.store.close(session_id)
+
+
+async def main(sessions: int, turns: int, latency: float, max_concurrency: int, tool_workers: int) -> None:
+    tools = Tools(max_workers=tool_workers)
+    tools.add_tool(get_weather, get_weather_tool)
+    llm = FakeLlm(latency)
+    engine = AsyncChatEngine(
+        tools=tools,
+        developer_prompt="You are a helpful assistant that can answer questions about the weather.",
+        client=llm,
+        max_concurrency=max_concurrency,
+    )
+
+    latencies: list[float] = []
+    start = time.perf_counter()
+    await asyncio.gather(*(run_session(engine, f"session-{i}", turns, latencies) for i in range(sessions)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    print(f"{sessions} sessions x {turns} turns, {llm.requests} LLM requests in {elapsed:.2f}s")
+    print(f"sessions/sec: {sessions / elapsed:.1f}, turns/sec: {len(latencies) / elapsed:.1f}")
+    print(
+        f"turn latency p50: {statistics.median(latencies) * 1000:.1f} ms, "
+        f"p99: {latencies[int(0.99 * (len(latencies) - 1))] * 1000:.1f} ms"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=500)
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.05, help="mean fake LLM latency in seconds")
+    parser.add_argument("--max-concurrency", type=int, default=256, help="LLM requests in flight")
+    parser.add_argument("--tool-latency", type=float, default=0.0, help="get_weather latency in seconds")
+    parser.add_argument("--tool-workers", type=int, default=8, help="threads of the tool pool")
+    args = parser.parse_args()
+    TOOL_LATENCY = args.tool_latency
+    asyncio.run(main(args.sessions, args.turns, args.latency, args.max_concurrency, args.tool_workers))
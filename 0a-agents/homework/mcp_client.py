@@ -1,22 +1,48 @@
+import copy
+import hashlib
 import json
+import os
 import subprocess
+import threading
+from collections import deque
+from concurrent.futures import Future
 
-from typing import Dict, Any, List, Optional
+from typing import Callable, Dict, Any, List, Optional
 
 
 class MCPClient:
-    def __init__(self, server_command: List[str]):
+    def __init__(
+        self,
+        server_command: List[str],
+        request_timeout: Optional[float] = 30.0,
+        verbose: bool = True,
+        env: Optional[Dict[str, str]] = None,
+    ):
         """
         Initialize the FastMCP client.
         
         Args:
             server_command: Command to start the server (e.g., ["python", "server.py"])
+            request_timeout: Default timeout of a request in seconds (None waits forever)
+            verbose: Print the handshake and every tool call
+            env: Environment variables of the server process, added to the environment of this process
         """
         self.server_command = server_command
+        self.request_timeout = request_timeout
+        self.verbose = verbose
+        self.env = env
         self.process = None
         self.request_id = 0
         self.available_tools = {}
         self.is_initialized = False
+        # responses are read by a background thread and matched to the requests by id,
+        # so many requests can be in flight over one stdio pipe
+        self.pending: Dict[int, Future] = {}
+        self.notification_handlers: Dict[str, List[Callable[[Dict[str, Any]], None]]] = {}
+        self.stderr_lines = deque(maxlen=100)
+        self.lock = threading.Lock()  # pending and request ids, also taken by the reader thread
+        self.write_lock = threading.Lock()  # a blocked write to stdin mustn't stall the reader
+        self.reader = None
         
     def start_server(self):
         """Start the FastMCP server process"""
@@ -26,21 +52,89 @@ class MCPClient:
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
             text=True,
-            bufsize=0
+            bufsize=1,
+            env={**os.environ, **self.env} if self.env else None,
         )
-        print(f"Started server with command: {' '.join(self.server_command)}")
+        self.reader = threading.Thread(target=self._read_messages, name="mcp-reader", daemon=True)
+        self.reader.start()
+        threading.Thread(target=self._read_stderr, name="mcp-stderr", daemon=True).start()
+        if self.verbose:
+            print(f"Started server with command: {' '.join(self.server_command)}")
         
     def stop_server(self):
         """Stop the server process"""
         if self.process:
+            self.process.stdin.close()
             self.process.terminate()
             self.process.wait()
-            print("Server stopped")
+            self.reader.join(timeout=5)
+            if self.verbose:
+                print("Server stopped")
+
+    def on_notification(self, method: str, handler: Callable[[Dict[str, Any]], None]):
+        """Call handler(params) for every notification with the method, e.g. "notifications/tools/list_changed" """
+        self.notification_handlers.setdefault(method, []).append(handler)
+
+    def _read_stderr(self):
+        # stderr has to be drained, otherwise the server blocks once the pipe buffer is full
+        for line in self.process.stderr:
+            self.stderr_lines.append(line.rstrip())
+
+    def _read_messages(self):
+        """Background thread: resolves the futures of responses, dispatches notifications and server requests"""
+        for line in self.process.stdout:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                message = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # not a JSON-RPC message, e.g. a print of the server
+
+            if "method" not in message:  # response
+                with self.lock:
+                    future = self.pending.pop(message.get("id"), None)
+                if future is None:  # timed out or unknown id
+                    continue
+                if "error" in message:
+                    future.set_exception(Exception(f"Server error: {message['error']}"))
+                else:
+                    future.set_result(message.get("result", {}))
+            elif "id" in message:  # request from the server
+                self._answer_server_request(message)
+            else:
+                for handler in self.notification_handlers.get(message["method"], []):
+                    try:
+                        handler(message.get("params", {}))
+                    except Exception as e:  # keep the reader alive
+                        print(f"Notification handler for {message['method']} failed: {e}")
+
+        with self.lock:  # the server exited
+            pending, self.pending = self.pending, {}
+        for future in pending.values():
+            future.set_exception(RuntimeError("No response from server"))
+
+    def _answer_server_request(self, request: Dict[str, Any]):
+        if request["method"] == "ping":
+            response = {"jsonrpc": "2.0", "id": request["id"], "result": {}}
+        else:
+            response = {
+                "jsonrpc": "2.0",
+                "id": request["id"],
+                "error": {"code": -32601, "message": f"Method not found: {request['method']}"},
+            }
+        self._write(response)
+
+    def _write(self, message: Dict[str, Any]):
+        with self.write_lock:
+            self.process.stdin.write(json.dumps(message) + "\n")
+            self.process.stdin.flush()
             
     def _get_next_request_id(self) -> int:
         """Get the next request ID"""
-        self.request_id += 1
-        return self.request_id
+        with self.lock:
+            self.request_id += 1
+            return self.request_id
         
     def _send_notification(self, method: str, params: Optional[Dict[str, Any]] = None):
         """Send a notification (no response expected)"""
@@ -55,13 +149,10 @@ class MCPClient:
         if params:
             notification["params"] = params
             
-        # Send notification
-        notification_str = json.dumps(notification) + "\n"
-        self.process.stdin.write(notification_str)
-        self.process.stdin.flush()
-        
-    def _send_request(self, method: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
-        """Send a JSON-RPC request to the server via stdin"""
+        self._write(notification)
+
+    def _send_request_async(self, method: str, params: Optional[Dict[str, Any]] = None) -> Future:
+        """Send a JSON-RPC request to the server via stdin, the future is resolved with the result"""
         if not self.process:
             raise RuntimeError("Server not started")
             
@@ -73,27 +164,38 @@ class MCPClient:
         
         if params:
             request["params"] = params
-            
-        # Send request
-        request_str = json.dumps(request) + "\n"
-        self.process.stdin.write(request_str)
-        self.process.stdin.flush()
-        
-        # Read response
-        response_str = self.process.stdout.readline().strip()
-        if not response_str:
-            raise RuntimeError("No response from server")
-            
-        response = json.loads(response_str)
+
+        future = Future()
+        future.request_id = request["id"]
+        with self.lock:
+            self.pending[request["id"]] = future
+        self._write(request)
+        return future
+
+    def _wait(self, future: Future, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Result of a request, on timeout the request is cancelled on the server"""
+        timeout = self.request_timeout if timeout is None else timeout
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            with self.lock:
+                self.pending.pop(future.request_id, None)
+            self._send_notification(
+                "notifications/cancelled",
+                {"requestId": future.request_id, "reason": f"Timed out after {timeout}s"}
+            )
+            raise TimeoutError(f"No response from server after {timeout}s") from None
         
-        if "error" in response:
-            raise Exception(f"Server error: {response['error']}")
-            
-        return response.get("result", {})
+    def _send_request(
+        self, method: str, params: Optional[Dict[str, Any]] = None, timeout: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """Send a JSON-RPC request to the server via stdin and wait for the response"""
+        return self._wait(self._send_request_async(method, params), timeout)
         
     def initialize(self) -> Dict[str, Any]:
         """Send initialize request to the server"""
-        print("Sending initialize request...")
+        if self.verbose:
+            print("Sending initialize request...")
         
         result = self._send_request(
             "initialize",
@@ -110,24 +212,28 @@ class MCPClient:
             }
         )
         
-        print(f"Initialize response: {result}")
+        if self.verbose:
+            print(f"Initialize response: {result}")
         return result
         
     def initialized(self):
         """Send initialized notification to complete handshake"""
-        print("Sending initialized notification...")
+        if self.verbose:
+            print("Sending initialized notification...")
         
         self._send_notification("notifications/initialized")
         self.is_initialized = True
         
-        print("Handshake completed successfully")
+        if self.verbose:
+            print("Handshake completed successfully")
 
     def get_tools(self) -> List[Dict[str, Any]]:
         """Get available tools from the server"""
         if not self.is_initialized:
             raise RuntimeError("Client not initialized. Call initialize() and initialized() first.")
             
-        print("Retrieving available tools...")
+        if self.verbose:
+            print("Retrieving available tools...")
         
         result = self._send_request("tools/list")
         tools = result.get("tools", [])
@@ -135,28 +241,36 @@ class MCPClient:
         # Store tools for easy access
         self.available_tools = {tool["name"]: tool for tool in tools}
         
-        print(f"Available tools: {list(self.available_tools.keys())}")
+        if self.verbose:
+            print(f"Available tools: {list(self.available_tools.keys())}")
         return tools
         
-    def call_tool(self, tool_name: str, arguments: Dict[str, Any]) -> Any:
-        """Call a specific tool with given arguments"""
+    def call_tool_async(self, tool_name: str, arguments: Dict[str, Any]) -> Future:
+        """Send a tool call without waiting for the result, use wait() to get it"""
         if not self.is_initialized:
             raise RuntimeError("Client not initialized. Call initialize() and initialized() first.")
             
         if tool_name not in self.available_tools:
             raise ValueError(f"Tool '{tool_name}' not available. Available tools: {list(self.available_tools.keys())}")
             
-        print(f"Calling tool '{tool_name}' with arguments: {arguments}")
+        if self.verbose:
+            print(f"Calling tool '{tool_name}' with arguments: {arguments}")
         
-        result = self._send_request(
+        return self._send_request_async(
             "tools/call",
             {
                 "name": tool_name,
                 "arguments": arguments
             }
         )
+
+    def wait(self, future: Future, timeout: Optional[float] = None) -> Any:
+        """Result of call_tool_async"""
+        return self._wait(future, timeout)
         
-        return result
+    def call_tool(self, tool_name: str, arguments: Dict[str, Any], timeout: Optional[float] = None) -> Any:
+        """Call a specific tool with given arguments (thread-safe, calls from many threads run concurrently)"""
+        return self._wait(self.call_tool_async(tool_name, arguments), timeout)
         
     def list_available_tools(self):
         """Print information about available tools"""
@@ -182,6 +296,9 @@ class MCPClient:
             print("-" * 50)
 
 
+SCHEMA_TYPE_KEYS = {'type', 'anyOf', 'oneOf', 'allOf', '$ref', 'enum', 'const'}
+
+
 def convert_mcp_tool_to_function_format(mcp_tool):
     """
     Convert MCP tool format to function format.
@@ -221,17 +338,19 @@ def convert_mcp_tool_to_function_format(mcp_tool):
         }
     }
     
-    # Convert properties
-    if 'properties' in input_schema:
-        for prop_name, prop_info in input_schema['properties'].items():
-            function_tool["parameters"]["properties"][prop_name] = {
-                "type": prop_info.get('type', 'string'),
-                "description": prop_info.get('description', f"{prop_name.replace('_', ' ').title()}")
-            }
-            
-            # Add title as description if no description exists
-            if 'title' in prop_info and 'description' not in prop_info:
-                function_tool["parameters"]["properties"][prop_name]["description"] = prop_info['title']
+    # Copy the full property schemas (nested objects, enums, arrays, unions)
+    for prop_name, prop_info in input_schema.get('properties', {}).items():
+        prop_schema = copy.deepcopy(prop_info)
+        # Use title as description if no description exists
+        title = prop_schema.pop('title', None)
+        prop_schema.setdefault('description', title or prop_name.replace('_', ' ').title())
+        if not SCHEMA_TYPE_KEYS.intersection(prop_schema):
+            prop_schema['type'] = 'string'
+        function_tool["parameters"]["properties"][prop_name] = prop_schema
+
+    # definitions referenced by $ref in nested schemas
+    if '$defs' in input_schema:
+        function_tool["parameters"]["$defs"] = copy.deepcopy(input_schema['$defs'])
     
     return function_tool
 
@@ -250,25 +369,89 @@ def convert_tools_list(mcp_tools):
 
 
 
-class MCPTools:
+class ToolSchemaRegistry:
+    """
+    Function-format schemas of the tools of an MCP server, converted once.
+
+    tools/list is requested again only after notifications/tools/list_changed; the converted list is kept
+    when the hash of the tools/list result didn't change, and unchanged tools aren't converted again.
+    """
+
     def __init__(self, mcp_client):
         self.mcp_client = mcp_client
+        self.tools_hash = None
         self.tools = None
+        self.converted: Dict[str, Dict[str, Any]] = {}  # tool hash -> function format
+        self.stale = True
+        self.lock = threading.Lock()
+        mcp_client.on_notification("notifications/tools/list_changed", lambda params: self.invalidate())
+
+    @staticmethod
+    def _hash(value) -> str:
+        return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode()).hexdigest()
+
+    def invalidate(self):
+        self.stale = True
+
+    def get_tools(self) -> List[Dict[str, Any]]:
+        with self.lock:
+            if not self.stale:
+                return self.tools
+            self.stale = False  # a notification during the refresh marks it stale again
+
+            mcp_tools = [
+                tool.model_dump() if hasattr(tool, 'model_dump') else tool
+                for tool in self.mcp_client.get_tools()
+            ]
+            tools_hash = self._hash(mcp_tools)
+            if tools_hash == self.tools_hash:
+                return self.tools
+
+            converted = {}
+            for tool in mcp_tools:
+                tool_hash = self._hash(tool)
+                converted[tool_hash] = self.converted.get(tool_hash) or convert_mcp_tool_to_function_format(tool)
+            self.converted = converted
+            self.tools = list(converted.values())
+            self.tools_hash = tools_hash
+            return self.tools
+
+
+class MCPTools:
+    def __init__(self, mcp_client):
+        self.mcp_client = mcp_client
+        self.registry = ToolSchemaRegistry(mcp_client)
     
     def get_tools(self):
-        if self.tools is None:
-            mcp_tools = self.mcp_client.get_tools()
-            self.tools = convert_tools_list(mcp_tools)
-        return self.tools
+        return self.registry.get_tools()
 
     def function_call(self, tool_call_response):
-        function_name = tool_call_response.name
-        arguments = json.loads(tool_call_response.arguments)
+        return self.function_calls([tool_call_response])[0]
 
-        result = self.mcp_client.call_tool(function_name, arguments)
+    def function_calls(self, tool_call_responses):
+        """
+        All calls are sent at once (pipelined over the stdio connection), outputs are in the order of the calls.
+        A call that can't be sent (e.g. an unknown tool), fails on the server or times out
+        returns an error output, the other calls keep their results.
+        """
+        futures = []
+        for call in tool_call_responses:
+            try:
+                futures.append(self.mcp_client.call_tool_async(call.name, json.loads(call.arguments)))
+            except Exception as e:
+                futures.append(e)
 
-        return {
-            "type": "function_call_output",
-            "call_id": tool_call_response.call_id,
-            "output": json.dumps(result, indent=2),
-        }
\ No newline at end of file
+        outputs = []
+        for call, future in zip(tool_call_responses, futures):
+            try:
+                if isinstance(future, Exception):
+                    raise future
+                output = json.dumps(self.mcp_client.wait(future), indent=2)
+            except Exception as e:
+                output = json.dumps({"error": f"{call.name} failed: {type(e).__name__}: {e}"})
+            outputs.append({
+                "type": "function_call_output",
+                "call_id": call.call_id,
+                "output": output,
+            })
+        return outputs
@@ -1,10 +1,19 @@
-import asyncio
-from fastmcp import Client
+import sys
+import time
+
+from mcp_pool import MCPPool
+
+
+def main():
+    start = time.perf_counter()
+    # warm server processes are started in the background, the tools come from the cache after the first run;
+    # calls go to either process, so the weather is kept in SQLite shared by both
+    with MCPPool([sys.executable, "weather_server.py"], size=2, env={"WEATHER_STORE": "sqlite"}) as pool:
+        tools = pool.get_tools()
+        print(f"Available tools ({time.perf_counter() - start:.3f}s):", tools)
+        print("Set weather in Paris:", pool.call_tool("set_weather", {"city": "paris", "temp": 18.5}))
+        print("Weather in Paris:", pool.call_tool("get_weather", {"city": "paris"}))
 
-async def main():
-    async with Client("weather_server.py") as mcp_client:
-       tools = await mcp_client.list_tools()
-       print("Available tools:", tools)
 
 if __name__ == "__main__":
-    test = asyncio.run(main())
\ No newline at end of file
+    main()
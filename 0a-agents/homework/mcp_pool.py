@@ -0,0 +1,232 @@
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from typing import Any, Dict, List, Optional
+
+from mcp_client import MCPClient
+
+
+class MCPPool:
+    """
+    Pool of `size` warm, initialized MCP server processes started with the same command.
+
+    Tool calls go to the connection with the fewest requests in flight; a health check restarts
+    processes that died. The tools/list result is cached in `tools_cache_file` (invalidated when
+    the command or the server script changes), so get_tools() doesn't wait for the handshake.
+    Calls are spread over processes: the server must not keep state in process memory
+    (e.g. run weather_server.py with WEATHER_STORE=sqlite).
+    """
+
+    def __init__(
+        self,
+        server_command: List[str],
+        size: int = 4,
+        tools_cache_file: Optional[str] = "mcp_tools.cache",
+        health_check_interval: Optional[float] = 30.0,
+        request_timeout: Optional[float] = 30.0,
+        env: Optional[Dict[str, str]] = None,
+    ):
+        self.server_command = server_command
+        self.size = size
+        self.tools_cache_file = tools_cache_file
+        self.health_check_interval = health_check_interval
+        self.request_timeout = request_timeout
+        self.env = env  # added to the environment of the server processes
+        self.clients: List[Optional[MCPClient]] = [None] * size
+        self.starting = set(range(size))
+        self.tools: Optional[List[Dict[str, Any]]] = None
+        self.restarts = 0
+        self.lock = threading.Lock()
+        self.ready = threading.Event()  # at least one connection is up
+        self.closed = threading.Event()
+        self.health_checker = None
+        self.notification_handlers: List[tuple] = []
+
+    def __enter__(self) -> "MCPPool":
+        self.start(wait=False)  # calls wait for the first connection
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def start(self, wait: bool = True):
+        """Start the server processes concurrently, with wait=False they're started in the background"""
+        self.tools = self._load_tools_cache()
+        starter = threading.Thread(target=self._start_all, name="mcp-pool-start", daemon=True)
+        starter.start()
+        if self.health_check_interval is not None:
+            self.health_checker = threading.Thread(target=self._health_check_loop, name="mcp-pool-health", daemon=True)
+            self.health_checker.start()
+        if wait:
+            starter.join()
+
+    def _start_all(self):
+        with ThreadPoolExecutor(max_workers=self.size) as executor:
+            futures = [executor.submit(self._start_client, slot) for slot in range(self.size)]
+        for slot, future in enumerate(futures):
+            if future.exception() is not None:  # restarted by the health check
+                print(f"MCP server {slot} failed to start: {future.exception()}")
+        self.ready.set()  # don't block callers when no process started
+
+    def _start_client(self, slot: int):
+        self.starting.add(slot)
+        try:
+            client = self._connect()
+        finally:
+            self.starting.discard(slot)
+
+        with self.lock:
+            closed = self.closed.is_set()  # close() sets it before taking the clients
+            if not closed:
+                if self.tools is not None:  # the tools may have been refreshed while connecting
+                    client.available_tools = {tool["name"]: tool for tool in self.tools}
+                self.clients[slot] = client
+        if closed:
+            client.stop_server()
+            return
+        self.ready.set()
+
+    def _connect(self) -> MCPClient:
+        client = MCPClient(
+            self.server_command, request_timeout=self.request_timeout, verbose=False, env=self.env
+        )
+        client.start_server()
+        try:
+            client.initialize()
+            client.initialized()
+
+            tools = self.tools
+            if tools is None:
+                tools = client.get_tools()  # not under the lock, the other connections keep serving calls
+                self._set_tools(tools)
+            client.available_tools = {tool["name"]: tool for tool in tools}
+            client.on_notification("notifications/tools/list_changed", lambda params: self._invalidate_tools())
+            for method, handler in self.notification_handlers:
+                client.on_notification(method, handler)
+        except Exception:
+            client.stop_server()
+            raise
+        return client
+
+    def on_notification(self, method: str, handler):
+        """Register the handler on all connections (including restarted ones)"""
+        self.notification_handlers.append((method, handler))
+        with self.lock:
+            clients = [client for client in self.clients if client is not None]
+        for client in clients:
+            client.on_notification(method, handler)
+
+    def _set_tools(self, tools: List[Dict[str, Any]]):
+        """New tools/list result, applied to every connection"""
+        with self.lock:
+            self.tools = tools
+            for client in self.clients:
+                if client is not None:
+                    client.available_tools = {tool["name"]: tool for tool in tools}
+            self._save_tools_cache(tools)
+
+    def _invalidate_tools(self):
+        with self.lock:
+            self.tools = None
+        if self.tools_cache_file is not None and os.path.exists(self.tools_cache_file):
+            os.remove(self.tools_cache_file)
+
+    def _cache_key(self) -> str:
+        """Command and modification times of the files in it (the server script)"""
+        parts = [
+            f"{arg}:{os.stat(arg).st_mtime_ns}" if os.path.isfile(arg) else arg
+            for arg in self.server_command
+        ]
+        return hashlib.sha256("\n".join(parts).encode()).hexdigest()
+
+    def _load_tools_cache(self) -> Optional[List[Dict[str, Any]]]:
+        if self.tools_cache_file is None or not os.path.exists(self.tools_cache_file):
+            return None
+        with open(self.tools_cache_file) as f_in:
+            cached = json.load(f_in)
+        return cached["tools"] if cached.get("key") == self._cache_key() else None
+
+    def _save_tools_cache(self, tools: List[Dict[str, Any]]):
+        if self.tools_cache_file is None:
+            return
+        tmp_file = f"{self.tools_cache_file}.tmp"
+        with open(tmp_file, "w") as f_out:
+            json.dump({"key": self._cache_key(), "tools": tools}, f_out)
+        os.replace(tmp_file, self.tools_cache_file)
+
+    @staticmethod
+    def _is_alive(client: Optional[MCPClient]) -> bool:
+        return client is not None and client.process.poll() is None and client.reader.is_alive()
+
+    def _health_check_loop(self):
+        while not self.closed.wait(self.health_check_interval):
+            self.health_check()
+
+    def health_check(self):
+        """Restart dead processes and processes that don't answer a ping"""
+        for slot, client in enumerate(list(self.clients)):
+            if slot in self.starting:
+                continue
+            healthy = self._is_alive(client)  # False when the process failed to start
+            if healthy:
+                try:
+                    client._send_request("ping", timeout=5)
+                except Exception:
+                    healthy = False
+            if not healthy and not self.closed.is_set():
+                with self.lock:
+                    self.clients[slot] = None
+                if client is not None:
+                    try:
+                        client.stop_server()
+                    except Exception:
+                        pass
+                self.restarts += 1
+                try:
+                    self._start_client(slot)
+                except Exception as e:
+                    print(f"MCP server {slot} failed to restart: {e}")
+
+    def get_tools(self) -> List[Dict[str, Any]]:
+        """Cached tools/list result (waits for the first connection when there is no cache)"""
+        tools = self.tools
+        if tools is None:
+            self.ready.wait()
+            with self.lock:
+                tools = self.tools
+            if tools is None:  # invalidated by the server
+                tools = self._pick().get_tools()
+                self._set_tools(tools)
+        return tools
+
+    def _pick(self) -> MCPClient:
+        """The live connection with the fewest requests in flight"""
+        self.ready.wait()
+        with self.lock:
+            alive = [client for client in self.clients if self._is_alive(client)]
+        if not alive:
+            raise RuntimeError("No MCP server process is running")
+        return min(alive, key=lambda client: len(client.pending))
+
+    def call_tool_async(self, tool_name: str, arguments: Dict[str, Any]) -> Future:
+        client = self._pick()
+        future = client.call_tool_async(tool_name, arguments)
+        future.client = client
+        return future
+
+    def wait(self, future: Future, timeout: Optional[float] = None) -> Any:
+        return future.client.wait(future, timeout)
+
+    def call_tool(self, tool_name: str, arguments: Dict[str, Any], timeout: Optional[float] = None) -> Any:
+        return self.wait(self.call_tool_async(tool_name, arguments), timeout)
+
+    def close(self):
+        self.closed.set()
+        with self.lock:
+            clients, self.clients = self.clients, [None] * self.size
+        for client in clients:
+            if client is not None:
+                client.stop_server()
@@ -0,0 +1,97 @@
+import asyncio
+import os
+import sys
+import unittest
+
+from ollama import ChatResponse, Message
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # modules shared by 0a-agents
+from async_assistant import AsyncChatEngine
+from chat_assistant import Tools
+
+search_tool = {
+    "type": "function",
+    "function": {
+        "name": "search",
+        "description": "Search the FAQ database",
+        "parameters": {
+            "type": "object",
+            "properties": {"query": {"type": "string"}},
+            "required": ["query"],
+        }
+    }
+}
+
+
+def search(query: str) -> list[str]:
+    return [f"result for {query}"]
+
+
+class ToolHungryLlm:
+    """Asks for a search whenever tools are offered (with `stubborn` also without them), otherwise answers."""
+
+    def __init__(self, stubborn: bool = False) -> None:
+        self.stubborn = stubborn
+        self.requests = []
+
+    async def chat(self, model: str, messages: list, tools: list | None) -> ChatResponse:
+        self.requests.append((list(messages), tools))
+        if tools is None and not self.stubborn:
+            return ChatResponse(message=Message(role="assistant", content=f"answer {len(self.requests)}"))
+        return ChatResponse(message=Message(role="assistant", content="", tool_calls=[
+            Message.ToolCall(function=Message.ToolCall.Function(name="search", arguments={"query": "q"}))
+            for _ in range(2)
+        ]))
+
+
+def assert_tool_calls_answered(test: unittest.TestCase, messages: list[dict]) -> None:
+    for i, message in enumerate(messages):
+        if message.get("tool_calls"):
+            replies = messages[i + 1:i + 1 + len(message["tool_calls"])]
+            test.assertEqual([reply["role"] for reply in replies], ["tool"] * len(message["tool_calls"]))
+
+
+def run_two_turns(llm: ToolHungryLlm):
+    tools = Tools()
+    tools.add_tool(search, search_tool)
+    engine = AsyncChatEngine(tools, "You're a course assistant.", client=llm, max_tool_rounds=2)
+
+    async def two_turns():
+        return [await engine.ask("session", question) for question in ("first", "second")]
+
+    return asyncio.run(two_turns())
+
+
+class MaxToolRoundsTest(unittest.TestCase):
+
+    def test_turns_past_the_limit(self):
+        llm = ToolHungryLlm()
+        first, second = run_two_turns(llm)
+
+        # 2 tool rounds and the final request without tools, per turn
+        self.assertEqual(len(llm.requests), 6)
+        self.assertEqual([tools is None for _, tools in llm.requests], [False, False, True] * 2)
+        self.assertEqual((first.answer, second.answer), ("answer 3", "answer 6"))
+        self.assertEqual(len(first.tool_calls), 4)
+
+        for messages, _ in llm.requests:
+            assert_tool_calls_answered(self, messages)
+        second_turn_messages = llm.requests[3][0]
+        self.assertEqual(second_turn_messages[-1], {"role": "user", "content": "second"})
+        self.assertEqual(second_turn_messages[-2]["content"], "answer 3")
+
+    def test_tool_calls_without_tools_are_answered(self):
+        llm = ToolHungryLlm(stubborn=True)
+        first, second = run_two_turns(llm)
+
+        self.assertEqual(len(llm.requests), 6)
+        self.assertEqual(len(first.tool_calls), 4)  # the calls over the limit aren't run
+        for messages, _ in llm.requests:
+            assert_tool_calls_answered(self, messages)
+        second_turn_messages = llm.requests[3][0]
+        self.assertEqual(second_turn_messages[-1], {"role": "user", "content": "second"})
+        self.assertEqual(second_turn_messages[-2]["role"], "tool")
+
+
+if __name__ == "__main__":
+    unittest.main()
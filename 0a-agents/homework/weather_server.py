@@ -1,5 +1,9 @@
 from fastmcp import FastMCP
+import asyncio
+import os
 import random
+import sqlite3
+import threading
 
 mcp = FastMCP("Demo 🚀")
 
@@ -7,8 +11,83 @@ known_weather_data = {
     'berlin': 20.0
 }
 
+
+class MemoryWeatherStore:
+    """Temperatures in a dict of this process, guarded by an asyncio lock"""
+
+    def __init__(self, data: dict[str, float]):
+        self.data = dict(data)
+        self.lock = asyncio.Lock()
+
+    async def get_many(self, cities: list[str]) -> dict[str, float | None]:
+        async with self.lock:
+            return {city: self.data.get(city) for city in cities}
+
+    async def set_many(self, temps: dict[str, float]) -> None:
+        async with self.lock:
+            self.data.update(temps)
+
+
+class SqliteWeatherStore:
+    """Temperatures in SQLite (WAL), shared by all server processes using the same file"""
+
+    def __init__(self, path: str, data: dict[str, float]):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA busy_timeout=5000")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS weather (city TEXT PRIMARY KEY, temp REAL NOT NULL)")
+        self.conn.executemany("INSERT OR IGNORE INTO weather VALUES (?, ?)", data.items())
+        self.conn.commit()
+        self.lock = threading.Lock()  # one connection, queries run in worker threads
+
+    def _get_many(self, cities: list[str]) -> dict[str, float | None]:
+        if not cities:
+            return {}
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT city, temp FROM weather WHERE city IN ({','.join('?' * len(cities))})", cities
+            ).fetchall()
+        found = dict(rows)
+        return {city: found.get(city) for city in cities}
+
+    def _set_many(self, temps: dict[str, float]) -> None:
+        with self.lock:
+            self.conn.executemany("INSERT OR REPLACE INTO weather VALUES (?, ?)", temps.items())
+            self.conn.commit()
+
+    async def get_many(self, cities: list[str]) -> dict[str, float | None]:
+        return await asyncio.to_thread(self._get_many, cities)
+
+    async def set_many(self, temps: dict[str, float]) -> None:
+        await asyncio.to_thread(self._set_many, temps)
+
+
+def create_store():
+    """WEATHER_STORE=memory (default) or sqlite, the SQLite file is WEATHER_DB (default weather.sqlite)"""
+    if os.environ.get("WEATHER_STORE", "memory") == "sqlite":
+        return SqliteWeatherStore(os.environ.get("WEATHER_DB", "weather.sqlite"), known_weather_data)
+    return MemoryWeatherStore(known_weather_data)
+
+
+store = create_store()
+
+
+def normalize_city(city: str) -> str:
+    return city.strip().lower()
+
+
+async def lookup(cities: list[str]) -> dict[str, float]:
+    normalized = [normalize_city(city) for city in cities]
+    known = await store.get_many(list(set(normalized)))
+    # unknown cities get a random temperature
+    return {
+        city: known[key] if known[key] is not None else round(random.uniform(-5, 35), 1)
+        for city, key in zip(cities, normalized)
+    }
+
+
 @mcp.tool
-def get_weather(city: str) -> float:
+async def get_weather(city: str) -> float:
     """
     Retrieves the temperature for a specified city.
 
@@ -18,15 +97,10 @@ def get_weather(city: str) -> float:
     Returns:
         float: The temperature associated with the city.
     """
-    city = city.strip().lower()
-
-    if city in known_weather_data:
-        return known_weather_data[city]
-
-    return round(random.uniform(-5, 35), 1)
+    return (await lookup([city]))[city]
 
 @mcp.tool
-def set_weather(city: str, temp: float) -> None:
+async def set_weather(city: str, temp: float) -> None:
     """
     Sets the temperature for a specified city.
 
@@ -37,9 +111,35 @@ def set_weather(city: str, temp: float) -> None:
     Returns:
         str: A confirmation string 'OK' indicating successful update.
     """
-    city = city.strip().lower()
-    known_weather_data[city] = temp
+    await store.set_many({normalize_city(city): temp})
+    return 'OK'
+
+@mcp.tool
+async def get_weather_many(cities: list[str]) -> dict[str, float]:
+    """
+    Retrieves the temperatures for several cities in one call.
+
+    Parameters:
+        cities (list[str]): The names of the cities for which to retrieve weather data.
+
+    Returns:
+        dict[str, float]: The temperature associated with each city.
+    """
+    return await lookup(cities)
+
+@mcp.tool
+async def set_weather_many(temps: dict[str, float]) -> str:
+    """
+    Sets the temperatures for several cities in one call.
+
+    Parameters:
+        temps (dict[str, float]): The temperature to associate with each city.
+
+    Returns:
+        str: A confirmation string 'OK' indicating successful update.
+    """
+    await store.set_many({normalize_city(city): temp for city, temp in temps.items()})
     return 'OK'
 
 if __name__ == "__main__":
-    mcp.run()
\ No newline at end of file
+    mcp.run()
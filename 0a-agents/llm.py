@@ -1,21 +1,224 @@
+import asyncio
+import json
+import time
+from collections.abc import AsyncIterator
+from dataclasses import dataclass
+from typing import Any
+
+import httpx
 from ollama import chat
+from ollama import AsyncClient
 from ollama import ChatResponse
 
+from tracing import add_span, record_llm_response, span
+
+KEEP_ALIVE = "30m"  # keep the model and its prompt cache loaded between agent iterations
+
+_decoder = json.JSONDecoder()
+
+
+def parse_json_object(text: str) -> dict[str, Any]:
+    """Parse the first JSON object in the text, ignoring any text the model added around it."""
+    try:
+        result = json.loads(text)
+        if isinstance(result, dict):
+            return result
+    except json.JSONDecodeError:
+        pass
+
+    start = text.find("{")
+    while start != -1:
+        try:
+            result, _ = _decoder.raw_decode(text, start)
+            if isinstance(result, dict):
+                return result
+        except json.JSONDecodeError:
+            pass
+        start = text.find("{", start + 1)
+    raise ValueError(f"No JSON object in the response: {text[:200]!r}")
+
+
+def _messages(prompt_template: str, system: str | None) -> list[dict[str, str]]:
+    messages = [{'role': 'system', 'content': system}] if system is not None else []
+    messages.append({
+        'role': 'user',
+        'content': prompt_template,
+    })
+    return messages
+
+
+@dataclass
+class StreamMetrics:
+    time_to_first_token: float | None = None
+    total_time: float | None = None
+    chunks: int = 0
+    prompt_eval_count: int | None = None
+    eval_count: int | None = None
+    tokens_per_second: float | None = None
+
+    def update(self, chunk: ChatResponse, start: float) -> None:
+        if chunk.message.content:
+            if self.time_to_first_token is None:
+                self.time_to_first_token = time.perf_counter() - start
+            self.chunks += 1
+        if chunk.done:
+            self.prompt_eval_count = chunk.prompt_eval_count
+            self.eval_count = chunk.eval_count
+            if chunk.eval_count and chunk.eval_duration:
+                self.tokens_per_second = chunk.eval_count / (chunk.eval_duration / 1e9)
+
+    def finish(self, start: float) -> None:
+        self.total_time = time.perf_counter() - start
+        # fallback when the server doesn't report eval stats - one chunk is one token,
+        # the first chunk arrived at time_to_first_token, so it isn't generated in the interval after it
+        if self.tokens_per_second is None and self.time_to_first_token is not None and self.chunks >= 2:
+            generation_time = self.total_time - self.time_to_first_token
+            self.tokens_per_second = (self.chunks - 1) / generation_time if generation_time > 0 else None
+
+    def __str__(self) -> str:
+        ttft = f"{self.time_to_first_token:.2f}s" if self.time_to_first_token is not None else "-"
+        tps = f"{self.tokens_per_second:.1f}" if self.tokens_per_second is not None else "-"
+        return f"time to first token: {ttft}, tokens/s: {tps}, total: {self.total_time:.2f}s"
+
 
 class Llm:
 
     def __init__(self, model: str):
         self.model = model
 
-    def get_chat_esponse(self, prompt_template: str) -> str:
-        response: ChatResponse = chat(model=self.model, messages=[
-            {
-                'role': 'user',
-                'content': prompt_template,
-            },
-        ])
+    def get_chat_esponse(
+        self,
+        prompt_template: str,
+        system: str | None = None,
+        keep_alive: float | str | None = KEEP_ALIVE,
+    ) -> str:
+        """
+        Put the static part of the prompt in `system`: it's sent first, so Ollama reuses its KV cache
+        between requests as long as the model stays loaded (`keep_alive`).
+        """
+        with span("llm.chat", model=self.model) as chat_span:
+            response: ChatResponse = chat(
+                model=self.model, messages=_messages(prompt_template, system), keep_alive=keep_alive
+            )
+            record_llm_response(chat_span, response)
         return response.message.content
+
+    def get_json_response(
+        self,
+        prompt_template: str,
+        schema: dict[str, Any] | str = "json",
+        system: str | None = None,
+        keep_alive: float | str | None = KEEP_ALIVE,
+    ) -> dict[str, Any]:
+        """Response constrained by Ollama to the JSON `schema` (or any JSON object with "json"), parsed."""
+        with span("llm.json", model=self.model) as chat_span:
+            response: ChatResponse = chat(
+                model=self.model, messages=_messages(prompt_template, system), format=schema, keep_alive=keep_alive
+            )
+            record_llm_response(chat_span, response)
+        return parse_json_object(response.message.content)
     
     def get_response_with_tools(self, input: list, tools: list) -> ChatResponse:
-        response: ChatResponse = chat(model=self.model, messages=input, tools=tools)
-        return response
\ No newline at end of file
+        with span("llm.tools", model=self.model) as chat_span:
+            response: ChatResponse = chat(model=self.model, messages=input, tools=tools)
+            record_llm_response(chat_span, response)
+        return response
+
+
+class AsyncLlm:
+    """
+    Async Llm sharing one AsyncClient (pooled keep-alive connections) between all requests,
+    with at most `max_concurrency` requests in flight. Use it within a single event loop.
+    """
+
+    def __init__(self, model: str, host: str | None = None, max_concurrency: int = 4):
+        self.model = model
+        # the transport is ours, so it can be closed (ollama's AsyncClient has no close());
+        # requests are limited by the semaphore, streams still being read keep their connection
+        self.transport = httpx.AsyncHTTPTransport(
+            limits=httpx.Limits(max_connections=None, max_keepalive_connections=max_concurrency)
+        )
+        self.client = AsyncClient(host=host, transport=self.transport)
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def __aenter__(self) -> "AsyncLlm":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+    async def get_chat_esponse(
+        self,
+        prompt_template: str,
+        system: str | None = None,
+        keep_alive: float | str | None = KEEP_ALIVE,
+    ) -> str:
+        async with self.semaphore:
+            with span("llm.chat", model=self.model) as chat_span:
+                response: ChatResponse = await self.client.chat(
+                    model=self.model, messages=_messages(prompt_template, system), keep_alive=keep_alive
+                )
+                record_llm_response(chat_span, response)
+        return response.message.content
+
+    async def get_json_response(
+        self,
+        prompt_template: str,
+        schema: dict[str, Any] | str = "json",
+        system: str | None = None,
+        keep_alive: float | str | None = KEEP_ALIVE,
+    ) -> dict[str, Any]:
+        async with self.semaphore:
+            with span("llm.json", model=self.model) as chat_span:
+                response: ChatResponse = await self.client.chat(
+                    model=self.model, messages=_messages(prompt_template, system), format=schema, keep_alive=keep_alive
+                )
+                record_llm_response(chat_span, response)
+        return parse_json_object(response.message.content)
+
+    async def get_response_with_tools(self, input: list, tools: list) -> ChatResponse:
+        async with self.semaphore:
+            with span("llm.tools", model=self.model) as chat_span:
+                response: ChatResponse = await self.client.chat(model=self.model, messages=input, tools=tools)
+                record_llm_response(chat_span, response)
+        return response
+
+    async def stream_chat_response(
+        self,
+        prompt_template: str,
+        metrics: StreamMetrics | None = None,
+        system: str | None = None,
+        keep_alive: float | str | None = KEEP_ALIVE,
+    ) -> AsyncIterator[str]:
+        """
+        Yield response tokens as they arrive. Metrics of the call are filled into `metrics` (if passed),
+        they're complete when the stream ends or is closed early.
+        """
+        start = time.perf_counter()
+        metrics = metrics if metrics is not None else StreamMetrics()
+        chunks = await self.client.chat(
+            model=self.model, messages=_messages(prompt_template, system), keep_alive=keep_alive, stream=True
+        )
+        try:
+            # the request is sent with the first chunk, a slow consumer doesn't hold the semaphore
+            async with self.semaphore:
+                chunk = await anext(chunks, None)
+            while chunk is not None:
+                metrics.update(chunk, start)
+                if chunk.message.content:
+                    yield chunk.message.content
+                chunk = await anext(chunks, None)
+        finally:
+            await chunks.aclose()
+            metrics.finish(start)
+            add_span(
+                "llm.stream", start, model=self.model, time_to_first_token=metrics.time_to_first_token,
+                prompt_eval_count=metrics.prompt_eval_count, eval_count=metrics.eval_count
+            )
+
+    async def gather_responses(self, prompts: list[str]) -> list[str]:
+        """Answer all prompts concurrently, responses are returned in the order of prompts."""
+        return await asyncio.gather(*(self.get_chat_esponse(prompt) for prompt in prompts))
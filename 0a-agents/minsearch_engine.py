@@ -1,10 +1,85 @@
+import os
+import pickle
+import numpy as np
 from minsearch.append import AppendableIndex
+from minsearch.minsearch import Index
+from scipy.sparse import csr_matrix
+from sklearn.preprocessing import normalize
+from tracing import traced
 
 class MiniSearchEngine:
-    def __init__(self, index: AppendableIndex, documents: list[dict[str, str]]) -> None:
+    """
+    Pass documents to fit the index, or skip them when the index is already fitted (e.g. loaded from a snapshot).
+    """
+
+    SNAPSHOT_STATE_FILE = "index.pkl"
+    SNAPSHOT_VERSION = 2  # bump when the snapshot layout or the search code relying on it changes
+
+    def __init__(self, index: AppendableIndex | Index, documents: list[dict[str, str]] | None = None) -> None:
         self.index = index
-        self.index.fit(documents)
+        if documents is not None:
+            self.index.fit(documents)
+
+    def save(self, path: str) -> None:
+        """
+        Save the fitted index to the `path` directory.
+        TF-IDF matrices are stored as raw CSR arrays (.npy) so they can be memory-mapped on load,
+        the rest of the index state (vectorizers with vocabulary, keyword fields, docs) is pickled.
+        """
+        os.makedirs(path, exist_ok=True)
+        state = vars(self.index).copy()
+        shapes = {}
+        for field, matrix in state.pop("text_matrices", {}).items():
+            matrix = csr_matrix(matrix)
+            for name in ("data", "indices", "indptr"):
+                np.save(os.path.join(path, f"{field}.{name}.npy"), getattr(matrix, name))
+            shapes[field] = matrix.shape
+
+        with open(os.path.join(path, self.SNAPSHOT_STATE_FILE), "wb") as file:
+            pickle.dump(
+                {"version": self.SNAPSHOT_VERSION, "cls": type(self.index), "state": state, "shapes": shapes},
+                file,
+                protocol=5,
+            )
+
+    @classmethod
+    def load(cls, path: str, index_cls: type = Index, mmap: bool = True) -> "MiniSearchEngine | None":
+        """
+        Load an index saved with `save`, memory-mapping the TF-IDF matrices so processes share the pages.
+        Returns None when there is no snapshot, or it has another format version or index class
+        (e.g. an AppendableIndex, which search_many can't score in one product) - rebuild it then.
+        """
+        snapshot_file = os.path.join(path, cls.SNAPSHOT_STATE_FILE)
+        if not os.path.exists(snapshot_file):
+            return None
+        with open(snapshot_file, "rb") as file:
+            try:
+                snapshot = pickle.load(file)
+            except (pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+                return None
+        if (
+            not isinstance(snapshot, dict)
+            or snapshot.get("version") != cls.SNAPSHOT_VERSION
+            or snapshot.get("cls") is not index_cls
+        ):
+            return None
+
+        index = snapshot["cls"].__new__(snapshot["cls"])
+        index.__dict__.update(snapshot["state"])
+        if snapshot["shapes"]:
+            mmap_mode = "r" if mmap else None
+            index.text_matrices = {
+                field: csr_matrix(
+                    tuple(np.load(os.path.join(path, f"{field}.{name}.npy"), mmap_mode=mmap_mode)
+                          for name in ("data", "indices", "indptr")),
+                    shape=shape,
+                    copy=False,
+                )
+                for field, shape in snapshot["shapes"].items()
+            }
+        return cls(index)
 
+    @traced("search.minsearch")
     def search(self, 
             query: str, 
             boost_dict: dict[str, int | float], 
@@ -18,4 +93,39 @@ class MiniSearchEngine:
             filter_dict=filter_dict,
             output_ids=True
         )
-        return results
\ No newline at end of file
+        return results
+
+    @traced("search.minsearch.many")
+    def search_many(self,
+            queries: list[str],
+            boost_dict: dict[str, int | float],
+            filter_dict: dict[str, str],
+            num_result: int = 5
+        ) -> list[list[dict[str, str]]]:
+        """
+        Search several queries at once. With a TF-IDF `Index` all queries are vectorized into one sparse
+        matrix per field and scored with a single matrix product, other indexes run one search per query.
+        """
+        if not hasattr(self.index, "text_matrices"):
+            return [self.search(query, boost_dict, filter_dict, num_result) for query in queries]
+        if not queries or not self.index.docs:
+            return [[] for _ in queries]
+
+        scores = np.zeros((len(queries), len(self.index.docs)))
+        for field in self.index.text_fields:
+            query_matrix = normalize(self.index.vectorizers[field].transform(queries))
+            # TfidfVectorizer rows are L2-normalized, so the dot product is the cosine similarity
+            scores += (query_matrix @ self.index.text_matrices[field].T).toarray() * boost_dict.get(field, 1)
+
+        for field, value in filter_dict.items():
+            if field in self.index.keyword_fields:
+                scores *= (self.index.keyword_df[field] == value).to_numpy()
+
+        return [self._top_documents(query_scores, num_result) for query_scores in scores]
+
+    def _top_documents(self, scores: np.ndarray, num_result: int) -> list[dict[str, str]]:
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > num_result:
+            candidates = candidates[np.argpartition(-scores[candidates], num_result - 1)[:num_result]]
+        top = candidates[np.argsort(-scores[candidates])]
+        return [{**self.index.docs[i], '_id': int(i)} for i in top]
@@ -1,10 +1,24 @@
+import contextvars
+import dataclasses
+import enum
+import functools
 import json
 import inspect
+import time
+import types
+import typing
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
 import markdown
 from IPython.display import display, HTML
 
 from openai import OpenAI
 
+# shared modules of 0a-agents, the scripts using this module put 0a-agents on sys.path
+from tool_cache import ToolCache
+from tracing import span, trace
+
 
 def shorten(text, max_length=50):
     if len(text) <= max_length:
@@ -13,10 +27,171 @@ def shorten(text, max_length=50):
     return text[:max_length - 3] + "..."
 
 
+# Map Python types to JSON schema types
+TYPE_MAP = {
+    str: "string",
+    int: "integer",
+    float: "number",
+    bool: "boolean",
+    dict: "object",
+    list: "array",
+    tuple: "array",
+}
+
+
+def type_hints(obj) -> dict[str, Any]:
+    """`typing.get_type_hints`, falling back to the raw annotations when a forward reference can't be resolved."""
+    try:
+        return typing.get_type_hints(obj)
+    except NameError:
+        return dict(getattr(obj, "__annotations__", {}))
+
+
+def type_schema(annotation) -> dict[str, Any]:
+    """JSON schema of a type annotation: builtins, list[X], dict, Optional/Union, Literal, Enum and dataclasses."""
+    origin = typing.get_origin(annotation)
+    args = typing.get_args(annotation)
+
+    if origin is typing.Literal:
+        schema = {"enum": list(args)}
+        if len({type(arg) for arg in args}) == 1 and type(args[0]) in TYPE_MAP:
+            schema["type"] = TYPE_MAP[type(args[0])]
+        return schema
+    if origin in (typing.Union, types.UnionType):
+        options = [arg for arg in args if arg is not type(None)]
+        schema = type_schema(options[0]) if len(options) == 1 else {"anyOf": [type_schema(arg) for arg in options]}
+        if len(options) < len(args):  # Optional
+            schema = {"anyOf": [schema, {"type": "null"}]}
+        return schema
+    if origin in (list, tuple, set, frozenset):
+        schema = {"type": "array"}
+        if args and args[-1] is not Ellipsis:
+            schema["items"] = type_schema(args[0])
+        return schema
+    if origin is dict:
+        return {"type": "object"}
+    if isinstance(annotation, type) and issubclass(annotation, enum.Enum):
+        return {"enum": [member.value for member in annotation]}
+    if dataclasses.is_dataclass(annotation):
+        hints = type_hints(annotation)
+        fields = dataclasses.fields(annotation)
+        return {
+            "type": "object",
+            "properties": {field.name: type_schema(hints.get(field.name, field.type)) for field in fields},
+            "required": [
+                field.name for field in fields
+                if field.default is dataclasses.MISSING and field.default_factory is dataclasses.MISSING
+            ],
+            "additionalProperties": False,
+        }
+    return {"type": TYPE_MAP.get(annotation, "string")}  # default to string
+
+
+def compile_converter(annotation) -> Callable[[Any], Any]:
+    """Checks (and converts, e.g. dict -> dataclass) a JSON argument value for the annotation, raises TypeError."""
+    origin = typing.get_origin(annotation)
+    args = typing.get_args(annotation)
+
+    if annotation is inspect.Parameter.empty or annotation is Any:
+        return lambda value: value
+    if origin is typing.Literal:
+        allowed = set(args)
+
+        def convert_literal(value):
+            if value not in allowed:
+                raise TypeError(f"expected one of {list(args)}, got {value!r}")
+            return value
+        return convert_literal
+    if origin in (typing.Union, types.UnionType):
+        optional = type(None) in args
+        converters = [compile_converter(arg) for arg in args if arg is not type(None)]
+
+        def convert_union(value):
+            if value is None and optional:
+                return None
+            for convert in converters:
+                try:
+                    return convert(value)
+                except TypeError:
+                    pass
+            raise TypeError(f"unexpected value {value!r}")
+        return convert_union
+    if origin in (list, tuple, set, frozenset) or annotation in (list, tuple):
+        convert_item = compile_converter(args[0]) if args and args[-1] is not Ellipsis else (lambda value: value)
+        container = origin or annotation
+
+        def convert_list(value):
+            if not isinstance(value, list):
+                raise TypeError(f"expected an array, got {value!r}")
+            return container(convert_item(item) for item in value)
+        return convert_list
+    if isinstance(annotation, type) and issubclass(annotation, enum.Enum):
+        return lambda value: annotation(value)
+    if dataclasses.is_dataclass(annotation):
+        validate = compile_validator(annotation)
+        return lambda value: annotation(**validate(value))
+    if annotation is float:
+        def convert_float(value):
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise TypeError(f"expected a number, got {value!r}")
+            return float(value)
+        return convert_float
+    if annotation in TYPE_MAP:
+        def convert_type(value):
+            if not isinstance(value, annotation) or (annotation is int and isinstance(value, bool)):
+                raise TypeError(f"expected {TYPE_MAP[annotation]}, got {value!r}")
+            return value
+        return convert_type
+    return lambda value: value
+
+
+def compile_validator(function) -> Callable[[dict[str, Any]], dict[str, Any]]:
+    """Validator of the JSON arguments of a function (or dataclass fields), built once from its signature."""
+    hints = type_hints(function)
+    parameters = inspect.signature(function).parameters.values()
+    converters = {param.name: compile_converter(hints.get(param.name, param.annotation)) for param in parameters}
+    required = {param.name for param in parameters if param.default is inspect.Parameter.empty}
+
+    def validate(arguments: dict[str, Any]) -> dict[str, Any]:
+        if not isinstance(arguments, dict):
+            raise TypeError(f"expected an object, got {arguments!r}")
+        unknown = arguments.keys() - converters.keys()
+        if unknown:
+            raise TypeError(f"unexpected arguments: {sorted(unknown)}")
+        missing = required - arguments.keys()
+        if missing:
+            raise TypeError(f"missing arguments: {sorted(missing)}")
+        converted = {}
+        for name, value in arguments.items():
+            try:
+                converted[name] = converters[name](value)
+            except (TypeError, ValueError) as e:
+                raise TypeError(f"{name}: {e}") from None
+        return converted
+    return validate
+
+
+_descriptions: dict[Callable, dict[str, Any]] = {}
+_validators: dict[Callable, Callable[[dict[str, Any]], dict[str, Any]]] = {}
+
+
+def get_validator(function) -> Callable[[dict[str, Any]], dict[str, Any]]:
+    """compile_validator cached per function (shared by all instances for methods)."""
+    key = getattr(function, "__func__", function)
+    if key not in _validators:
+        _validators[key] = compile_validator(function)
+    return _validators[key]
+
+
 def generate_description(function):
     """
     Generate a tool description schema for a given function using its docstring and signature.
+    Descriptions are cached per function (shared by all instances for methods), don't modify them.
     """
+    key = getattr(function, "__func__", function)
+    description = _descriptions.get(key)
+    if description is not None:
+        return description
 
     # Get function name and docstring
     name = function.__name__
@@ -24,26 +199,16 @@ def generate_description(function):
 
     # Get function signature
     sig = inspect.signature(function)
+    hints = type_hints(function)
     properties = {}
     required = []
 
     for param in sig.parameters.values():
         param_name = param.name
-        param_type = param.annotation if param.annotation != inspect._empty else str
-
-        # Map Python types to JSON schema types
-        type_map = {
-            str: "string",
-            int: "integer",
-            float: "number",
-            bool: "boolean",
-            dict: "object",
-            list: "array"
-        }
-        json_type = type_map.get(param_type, "string")  # default to string
+        param_type = hints.get(param_name, str)
 
         properties[param_name] = {
-            "type": json_type,
+            **type_schema(param_type),
             "description": f"{param_name} parameter"
         }
 
@@ -51,7 +216,7 @@ def generate_description(function):
         if param.default == inspect._empty:
             required.append(param_name)
 
-    return {
+    description = _descriptions[key] = {
         "type": "function",
         "name": name,
         "description": doc,
@@ -62,16 +227,41 @@ def generate_description(function):
             "additionalProperties": False
         }
     }
+    return description
+
+
+@functools.cache
+def public_method_names(cls) -> list[str]:
+    return [
+        name for name, member in inspect.getmembers(cls, predicate=lambda m: inspect.isfunction(m) or inspect.ismethod(m))
+        if not name.startswith("_")  # skip private and special methods
+    ]
 
 
 class Tools:
 
-    def __init__(self):
+    def __init__(self, max_workers: int = 8):
         self.tools = {}
         self.functions = {}
+        self.timeouts = {}
+        self.caches: dict[str, ToolCache] = {}
+        self.invalidates: dict[str, list[str]] = {}
+        self.validators = {}
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tool")
+        self._payload = None
     
-    def add_tool(self, function, description=None):
+    def add_tool(
+        self,
+        function,
+        description=None,
+        timeout: float | None = None,
+        cache: ToolCache | None = None,
+        invalidates: list[str] | None = None,
+    ):
         """
+            `cache` memoizes the results of the tool, `invalidates` lists the tools
+            whose cached results are cleared when this tool runs (e.g. set_weather -> get_weather).
+
             tool_description = {
                 "type": "function",               # This identifies it as a function/tool.
                 "name": "<function_name>",       # Name of the function as it will be exposed.
@@ -94,24 +284,65 @@ class Tools:
             description = generate_description(function)
         self.tools[function.__name__] = description
         self.functions[function.__name__] = function
+        self.validators[function.__name__] = get_validator(function)
+        self.timeouts[function.__name__] = timeout
+        self._payload = None
+        if cache is not None:
+            self.caches[function.__name__] = cache
+        self.invalidates[function.__name__] = invalidates or []
+
+    def cache_stats(self) -> dict[str, dict[str, int]]:
+        return {name: cache.stats() for name, cache in self.caches.items()}
 
     def add_tools(self, instance):
-        for name, method in inspect.getmembers(instance, predicate=inspect.ismethod):
-            if not name.startswith("_"):  # skip private and special methods
-                self.add_tool(method)
+        for name in public_method_names(type(instance)):
+            self.add_tool(getattr(instance, name))
     
     def get_tools(self):
-        return list(self.tools.values())
+        """The same list is returned until a tool is added, don't modify it."""
+        if self._payload is None:
+            self._payload = list(self.tools.values())
+        return self._payload
 
     def function_call(self, tool_call_response):
-        args = json.loads(tool_call_response.arguments)
-
         f_name = tool_call_response.name
-        f = self.functions[f_name]
-        
         call_id = tool_call_response.call_id
+
+        f = self.functions.get(f_name)
+        if f is None:  # let the model pick one of the tools
+            return {
+                "type": "function_call_output",
+                "call_id": call_id,
+                "output": json.dumps({"error": f"unknown tool {f_name}"}),
+            }
+
+        try:
+            raw_args = json.loads(tool_call_response.arguments)
+            args = self.validators[f_name](raw_args)
+        except (TypeError, ValueError) as e:  # let the model correct the call
+            return {
+                "type": "function_call_output",
+                "call_id": call_id,
+                "output": json.dumps({"error": f"invalid arguments for {f_name}: {e}"}),
+            }
     
-        results = f(**args)
+        cache = self.caches.get(f_name)
+        with span("tool", name=f_name) as tool_span:
+            if cache is None:
+                results = f(**args)
+            else:
+                key = cache.key(raw_args)
+                generation = cache.generation
+                results = cache.get(key)
+                tool_span.attributes["cached"] = results is not ToolCache.MISSING
+                if results is ToolCache.MISSING:
+                    results = f(**args)
+                    cache.put(key, results, generation)
+
+        for name in self.invalidates.get(f_name, []):
+            if name in self.caches:
+                self.caches[name].clear()
+
         output_json = json.dumps(results)
         
         call_output = {
@@ -122,6 +353,39 @@ class Tools:
     
         return call_output
 
+    def function_calls(self, tool_call_responses):
+        """
+        Run the calls concurrently, outputs are in the order of the calls.
+        A call exceeding the timeout of its tool or raising an exception returns an error output instead
+        (a timed out call can't be interrupted and finishes in the background).
+        """
+        start = time.monotonic()
+        # each call runs in a copy of the caller's context, so its span belongs to the caller's trace
+        futures = [
+            self.executor.submit(contextvars.copy_context().run, self.function_call, call)
+            for call in tool_call_responses
+        ]
+
+        call_outputs = []
+        for call, future in zip(tool_call_responses, futures):
+            timeout = self.timeouts.get(call.name)
+            try:
+                remaining = None if timeout is None else max(0.0, start + timeout - time.monotonic())
+                call_outputs.append(future.result(timeout=remaining))
+            except TimeoutError:
+                call_outputs.append({
+                    "type": "function_call_output",
+                    "call_id": call.call_id,
+                    "output": json.dumps({"error": f"{call.name} timed out after {timeout}s"}),
+                })
+            except Exception as e:  # a failing tool doesn't discard the outputs of the other calls
+                call_outputs.append({
+                    "type": "function_call_output",
+                    "call_id": call.call_id,
+                    "output": json.dumps({"error": f"{call.name} failed: {type(e).__name__}: {e}"}),
+                })
+        return call_outputs
+
 class IPythonChatInterface:
 
     def input(self):
@@ -182,33 +446,41 @@ class ChatAssistant:
         
             chat_messages.append({"role": "user", "content": question})
         
-            while True:
-                response = self.openai_client.responses.create(
-                    model='gpt-4o-mini',
-                    input=chat_messages,
-                    tools=self.tools.get_tools()
-                )
+            with trace("chat.turn", question=question):
+                while True:
+                    with span("llm.responses", model='gpt-4o-mini') as llm_span:
+                        response = self.openai_client.responses.create(
+                            model='gpt-4o-mini',
+                            input=chat_messages,
+                            tools=self.tools.get_tools()
+                        )
+                        if response.usage is not None:
+                            llm_span.attributes["input_tokens"] = response.usage.input_tokens
+                            llm_span.attributes["output_tokens"] = response.usage.output_tokens
         
-                has_function_call = False
+                    has_function_call = False
+                    # independent calls run concurrently, their outputs are added in order
+                    calls = [entry for entry in response.output if entry.type == 'function_call']
+                    call_outputs = iter(self.tools.function_calls(calls))
                 
-                for entry in response.output:    
-                    chat_messages.append(entry)
+                    for entry in response.output:    
+                        chat_messages.append(entry)
                 
-                    if entry.type == 'message':
-                        md_content = entry.content[0].text
-                        self.interface.display_response(md_content)
+                        if entry.type == 'message':
+                            md_content = entry.content[0].text
+                            self.interface.display_response(md_content)
         
-                    if entry.type == 'function_call':
-                        call_output = self.tools.function_call(entry)
+                        if entry.type == 'function_call':
+                            call_output = next(call_outputs)
         
-                        name = entry.name
-                        arguments = entry.arguments
-                        output = call_output['output']
-                        self.interface.display_function_call(name, arguments, output)
+                            name = entry.name
+                            arguments = entry.arguments
+                            output = call_output['output']
+                            self.interface.display_function_call(name, arguments, output)
         
-                        chat_messages.append(call_output)
-                        has_function_call = True
+                            chat_messages.append(call_output)
+                            has_function_call = True
         
-                if not has_function_call:
-                    break
+                    if not has_function_call:
+                        break
 
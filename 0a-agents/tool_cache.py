@@ -0,0 +1,55 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+
+class ToolCache:
+    """
+    LRU cache of tool results keyed on the canonical JSON of the arguments, entries expire after `ttl` seconds.
+    `clear()` (called when a tool listed in `invalidates` runs) also discards results of calls in flight.
+    """
+    MISSING = object()
+
+    def __init__(self, ttl: float | None = 300, max_size: int = 256):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(arguments: dict[str, Any]) -> str:
+        return json.dumps(arguments, sort_keys=True, separators=(",", ":"))
+
+    def get(self, key: str) -> Any:
+        """Cached result or `ToolCache.MISSING`."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and (self.ttl is None or time.monotonic() - entry[0] < self.ttl):
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.entries.pop(key, None)
+            self.misses += 1
+            return self.MISSING
+
+    def put(self, key: str, result: Any, generation: int) -> None:
+        with self.lock:
+            if generation != self.generation:  # invalidated while the tool was running
+                return
+            self.entries[key] = (time.monotonic(), result)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.generation += 1
+
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.entries)}